@@ -1,5 +1,9 @@
 from django.contrib import admin
 from django.contrib.auth.admin import UserAdmin
+from django.core.paginator import Paginator
+from django.db import connections
+from django.db.models import Exists, OuterRef, Q
+from django.utils.functional import cached_property
 
 from authentication.models import (
     AcademicDegree,
@@ -11,6 +15,7 @@ from authentication.models import (
     Division,
     EducationDepartment,
     Institute,
+    InternalApiKey,
     Requirement,
     Role,
     StudentProfile,
@@ -18,6 +23,80 @@ from authentication.models import (
 )
 
 
+class EstimatedCountPaginator(Paginator):
+    """
+    Takes the row count of an unfiltered table of more than
+    ``estimate_above`` rows from the PostgreSQL statistics. Filtered
+    rows are counted, so every page of a filtered list can be reached.
+    """
+
+    estimate_above = 10_000
+
+    @cached_property
+    def count(self):
+        query = self.object_list.query
+        connection = connections[self.object_list.db]
+        if not query.where and connection.vendor == "postgresql":
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    "SELECT reltuples FROM pg_class WHERE relname = %s",
+                    [self.object_list.model._meta.db_table],
+                )
+                row = cursor.fetchone()
+            if row and row[0] > self.estimate_above:
+                return int(row[0])
+        return self.object_list.order_by().count()
+
+
+class PrefixSearchMixin:
+    """
+    Searches ``search_fields`` by the beginning of the words, which the
+    indexes on the names can serve. Case insensitive search could
+    not use them, so every term is looked up as typed, in lower and
+    upper case, capitalized and title cased, which finds "McDonald" by
+    "McD", "Иванов" by "иван" and "Петрова-Водкина" by its lower case.
+    """
+
+    def get_search_results(self, request, queryset, search_term):
+        for term in search_term.split():
+            # dict keeps the order, so the query is the same every time
+            variants = dict.fromkeys(
+                (
+                    term,
+                    term.lower(),
+                    term.upper(),
+                    term.capitalize(),
+                    term.title(),
+                )
+            )
+            condition = Q()
+            for field in self.get_search_fields(request):
+                for variant in variants:
+                    condition |= Q(**{f"{field}__startswith": variant})
+            queryset = queryset.filter(condition)
+        return queryset, False
+
+
+class RoleListFilter(admin.SimpleListFilter):
+    title = "roles"
+    parameter_name = "role"
+
+    def lookups(self, request, model_admin):
+        return Role.ROLE_CHOICES
+
+    def queryset(self, request, queryset):
+        if self.value() is None:
+            return queryset
+        # EXISTS instead of a join, the join needs DISTINCT over all rows
+        return queryset.filter(
+            Exists(
+                CustomUser.roles.through.objects.filter(
+                    customuser=OuterRef("pk"), role=self.value()
+                )
+            )
+        )
+
+
 class ProfileInline(admin.StackedInline):
     model = BrsAdminProfile
     can_delete = False
@@ -25,8 +104,10 @@ class ProfileInline(admin.StackedInline):
     fk_name = "user"
 
 
-class CustomUserAdmin(UserAdmin):
+class CustomUserAdmin(PrefixSearchMixin, UserAdmin):
     inlines = (ProfileInline,)
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
 
     fieldsets = (
         (None, {"fields": ("username", "password")}),
@@ -47,7 +128,7 @@ class CustomUserAdmin(UserAdmin):
     )
     list_display = ("username", "middle_name", "first_name", "last_name")
     search_fields = ("username", "middle_name", "first_name", "last_name")
-    list_filter = ("is_staff", "is_superuser", "is_active", "roles")
+    list_filter = ("is_staff", "is_superuser", "is_active", RoleListFilter)
 
     add_fieldsets = (
         (
@@ -70,8 +151,15 @@ class CustomUserAdmin(UserAdmin):
         ),
     )
 
+    def get_queryset(self, request):
+        queryset = CustomUser.objects.lean()
+        ordering = self.get_ordering(request)
+        if ordering:
+            queryset = queryset.order_by(*ordering)
+        return queryset
+
     def get_inlines(self, request, obj):
-        if obj.is_brs_admin or obj.is_deccan:
+        if obj.roles.filter(pk__in=(Role.BRS_ADMIN, Role.DECCAN)).exists():
             return super().get_inlines(request, obj)
         return []
 
@@ -81,7 +169,7 @@ class CustomUserAdmin(UserAdmin):
         return super(CustomUserAdmin, self).get_inline_instances(request, obj)
 
 
-class ProfileAdmin(admin.ModelAdmin):
+class ProfileAdmin(PrefixSearchMixin, admin.ModelAdmin):
     search_fields = [
         "user__middle_name",
         "user__first_name",
@@ -91,11 +179,15 @@ class ProfileAdmin(admin.ModelAdmin):
     list_display = [
         "user",
     ]
+    list_select_related = ["user"]
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
 
 
 class ProfileStudentAdmin(ProfileAdmin):
     search_fields = ProfileAdmin.search_fields + ["group__name"]
     list_display = ["user", "group"]
+    list_select_related = ["user", "group"]
 
 
 admin.site.register(CustomUser, CustomUserAdmin)
@@ -113,4 +205,15 @@ admin.site.register(Requirement)
 admin.site.register(EducationDepartment)
 admin.site.register(Division)
 
-admin.site.register(AliasUser)
\ No newline at end of file
+admin.site.register(AliasUser)
+
+
+@admin.register(InternalApiKey)
+class InternalApiKeyAdmin(admin.ModelAdmin):
+    list_display = ["service", "scopes", "is_active", "created"]
+    list_filter = ["is_active"]
+    readonly_fields = ["key_hash"]
+
+    def has_add_permission(self, request):
+        # keys are issued by the create_internal_api_key command
+        return False
\ No newline at end of file
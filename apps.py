@@ -2,4 +2,10 @@ from django.apps import AppConfig
 
 
 class AuthenticationConfig(AppConfig):
-    name = "authentication"
\ No newline at end of file
+    name = "authentication"
+
+    def ready(self):
+        from authentication import autocomplete, scopes
+
+        autocomplete.build_on_startup()
+        scopes.connect_sources()
\ No newline at end of file
@@ -0,0 +1,170 @@
+import functools
+import math
+
+from asgiref.sync import sync_to_async
+from django.contrib.auth.models import AnonymousUser
+from django.core.cache import cache
+from django.http import HttpResponseNotAllowed, JsonResponse
+from rest_framework import exceptions, status
+from rest_framework.request import Request
+from rest_framework.settings import api_settings
+
+from authentication.models import CustomUser, Institute, Role, UserProfile
+from authentication.serializers import (
+    InstituteSerializer,
+    UserProfileSerializer,
+)
+from authentication.throttling import TelegramConnectRateThrottle
+
+
+def _authenticate(request):
+    authenticators = [
+        authenticator()
+        for authenticator in api_settings.DEFAULT_AUTHENTICATION_CLASSES
+    ]
+    try:
+        return Request(request, authenticators=authenticators).user
+    except exceptions.APIException:
+        # an expired, malformed or revoked token
+        return AnonymousUser()
+
+
+async def authenticate(request):
+    """
+    Authenticate with the DRF authentication classes, the JWT decoding
+    and the user lookup run in a worker thread. A rejected token gives
+    an anonymous user.
+    """
+    return await sync_to_async(_authenticate)(request)
+
+
+def _not_authenticated():
+    return JsonResponse(
+        {"detail": "Authentication credentials were not provided."},
+        status=status.HTTP_401_UNAUTHORIZED,
+    )
+
+
+async def check_throttle(request, user, throttle_class):
+    """
+    Check the request of ``user`` against ``throttle_class``, return
+    the seconds to wait when it is rejected, otherwise None.
+    """
+    request.user = user
+    throttle = throttle_class()
+    if await sync_to_async(throttle.allow_request)(request, None):
+        return None
+    return throttle.wait()
+
+
+def require_get(view):
+    """
+    ``require_GET`` for coroutine views, which it wraps only on Django 5.
+    """
+
+    @functools.wraps(view)
+    async def wrapper(request, *args, **kwargs):
+        if request.method != "GET":
+            return HttpResponseNotAllowed(["GET"])
+        return await view(request, *args, **kwargs)
+
+    return wrapper
+
+
+def _throttled(wait):
+    wait = math.ceil(wait)
+    response = JsonResponse(
+        {
+            "detail": "Request was throttled. "
+            f"Expected available in {wait} seconds."
+        },
+        status=status.HTTP_429_TOO_MANY_REQUESTS,
+    )
+    response["Retry-After"] = str(wait)
+    return response
+
+
+@require_get
+async def get_roles(request):
+    user = await authenticate(request)
+    if not user.is_authenticated:
+        return _not_authenticated()
+    roles = [
+        str(role) async for role in Role.objects.filter(customuser=user)
+    ]
+    if user.admin_dep == CustomUser.DUMR:
+        roles.append("dumr")
+    return JsonResponse(roles, safe=False)
+
+
+@require_get
+async def institute_list(request):
+    institutes = [institute async for institute in Institute.objects.all()]
+    return JsonResponse(
+        InstituteSerializer(institutes, many=True).data, safe=False
+    )
+
+
+@require_get
+async def get_user_profile(request, pk):
+    user = await authenticate(request)
+    if not user.is_authenticated:
+        return _not_authenticated()
+    try:
+        profile = await UserProfile.objects.select_related(
+            "user", "work_department", "education_department"
+        ).aget(user__pk=pk)
+    except UserProfile.DoesNotExist:
+        return JsonResponse(
+            {"detail": "Not found."}, status=status.HTTP_404_NOT_FOUND
+        )
+    serializer = UserProfileSerializer(profile, context={"request": request})
+    return JsonResponse(serializer.data)
+
+
+@require_get
+async def get_user_profile_stats(request):
+    user = await authenticate(request)
+    if not user.is_authenticated:
+        return _not_authenticated()
+    if not user.is_staff:
+        return JsonResponse({}, status=status.HTTP_404_NOT_FOUND)
+    stats = await UserProfile.objects.aaggregate(
+        **UserProfile.stats_aggregates()
+    )
+    return JsonResponse(stats)
+
+
+@require_get
+async def telegram_connect(request):
+    user = await authenticate(request)
+    if not user.is_authenticated:
+        return _not_authenticated()
+    wait = await check_throttle(request, user, TelegramConnectRateThrottle)
+    if wait is not None:
+        return _throttled(wait)
+    code = request.GET.get("code")
+
+    if not code or not (telegram_id := await cache.aget(code, None)):
+        return JsonResponse(
+            {"message": "Неверный код"}, status=status.HTTP_400_BAD_REQUEST
+        )
+
+    if user.telegram_id:
+        return JsonResponse(
+            {"message": "Нельзя подключить телеграм аккаунт"},
+            status=status.HTTP_400_BAD_REQUEST,
+        )
+
+    try:
+        user.telegram_id = int(telegram_id)
+        await user.asave(update_fields=["telegram_id"])
+    except Exception:
+        return JsonResponse(
+            {"message": "Ошибка выполнения"},
+            status=status.HTTP_500_INTERNAL_SERVER_ERROR,
+        )
+    await cache.adelete_many([code, telegram_id])
+    return JsonResponse(
+        {"message": "Аккаунт Telegram привязан"}, status=status.HTTP_200_OK
+    )
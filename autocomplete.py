@@ -0,0 +1,351 @@
+import threading
+import time
+import uuid
+from bisect import bisect_left, insort
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection, transaction
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from django.dispatch import receiver
+
+from authentication.models import CustomUser, Role, UserProfile
+
+VERSION_KEY = "autocomplete:version"
+KEY_LENGTH = 32
+SEPARATOR = "\x00"
+
+
+def normalize(value: str) -> str:
+    return " ".join(value.lower().replace("ё", "е").split())
+
+
+def role_mask(role_ids) -> int:
+    mask = 0
+    for role_id in role_ids:
+        mask |= 1 << role_id
+    return mask
+
+
+ROLE_IDS = {name: role_id for role_id, name in Role.ROLE_CHOICES}
+
+
+class NameIndex:
+    """
+    Sorted keys ``"<normalized name>\\0<user id>"`` searched with bisect.
+    Every user has a key starting at the surname and one starting at the
+    first name; keys are cut to ``KEY_LENGTH`` characters and the index
+    stops growing at ``max_users``, which bounds its memory.
+
+    Every committed change increments the version in the cache and is
+    applied in place by the process that made it. Other processes check
+    the version at most every ``sync_seconds`` and rebuild in a
+    background thread when theirs is behind, serving the old index
+    meanwhile.
+    """
+
+    def __init__(self, max_users: int = None, sync_seconds: float = None):
+        self.max_users = max_users or getattr(
+            settings, "AUTOCOMPLETE_MAX_USERS", 300_000
+        )
+        self.sync_seconds = (
+            sync_seconds
+            if sync_seconds is not None
+            else getattr(settings, "AUTOCOMPLETE_SYNC_SECONDS", 60)
+        )
+        self.built = False
+        self.version = None
+        self.synced = 0.0
+        self._keys = []
+        # user id: [fullname, role mask, institute id, keys]
+        self._users = {}
+        self.rebuild_thread = None
+        self._lock = threading.RLock()
+        self._build_lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._users)
+
+    @staticmethod
+    def _user_keys(user_id, middle_name, first_name, last_name):
+        keys = []
+        for name in (
+            (middle_name, first_name, last_name),
+            (first_name, last_name, middle_name),
+        ):
+            key = normalize(" ".join(name))[:KEY_LENGTH]
+            if key:
+                keys.append(f"{key}{SEPARATOR}{user_id}")
+        return tuple(keys)
+
+    def build(self):
+        with self._build_lock:
+            self._build()
+
+    def _build(self):
+        # read before the query, so a change committed meanwhile leaves
+        # the index with an old version and it is rebuilt again
+        version = cache.get_or_set(VERSION_KEY, _initial_version, None)
+        users = {}
+        queryset = (
+            CustomUser.objects.lean()
+            .filter(is_active=True)
+            .order_by("pk")
+            .values_list(
+                "pk",
+                "middle_name",
+                "first_name",
+                "last_name",
+                "userprofile__institute_id",
+            )
+        )
+        for user_id, middle, first, last, institute in queryset.iterator(
+            chunk_size=5000
+        ):
+            if len(users) >= self.max_users:
+                break
+            users[user_id] = [
+                " ".join((middle, first, last)),
+                0,
+                institute,
+                self._user_keys(user_id, middle, first, last),
+            ]
+
+        for user_id, role_id in (
+            CustomUser.roles.through.objects.filter(customuser__in=users)
+            .values_list("customuser_id", "role_id")
+            .iterator(chunk_size=5000)
+        ):
+            users[user_id][1] |= 1 << role_id
+
+        keys = sorted(key for user in users.values() for key in user[3])
+        with self._lock:
+            self._users = users
+            self._keys = keys
+            self.version = version
+            self.synced = time.monotonic()
+            self.built = True
+
+    def sync(self):
+        """
+        Build the index on first use, concurrent callers wait for a single
+        build. Later start a rebuild in the background when the version
+        in the cache is no longer the one of the index.
+        """
+        if self.built and time.monotonic() - self.synced < self.sync_seconds:
+            return
+        if not self.built:
+            with self._build_lock:
+                if not self.built:
+                    self._build()
+            return
+        self.synced = time.monotonic()
+        if cache.get(VERSION_KEY) == self.version:
+            return
+        if self._build_lock.acquire(blocking=False):
+            self.rebuild_thread = threading.Thread(
+                target=self._rebuild, name="autocomplete-build", daemon=True
+            )
+            self.rebuild_thread.start()
+
+    def _rebuild(self):
+        try:
+            self._build()
+        finally:
+            self._build_lock.release()
+            connection.close()
+
+    def apply(self, change, version):
+        """
+        Apply ``change(index)`` of this process; the index stays current
+        when ``version`` directly follows its own.
+        """
+        with self._lock:
+            change(self)
+            if self.version is not None and version == self.version + 1:
+                self.version = version
+
+    def _remove_keys(self, keys):
+        for key in keys:
+            index = bisect_left(self._keys, key)
+            if index < len(self._keys) and self._keys[index] == key:
+                del self._keys[index]
+
+    def update_user(
+        self, user_id, middle_name, first_name, last_name, is_active
+    ):
+        if not self.built:
+            return
+        with self._lock:
+            entry = self._users.pop(user_id, None)
+            if entry is not None:
+                self._remove_keys(entry[3])
+            if not is_active:
+                return
+            if entry is None and len(self._users) >= self.max_users:
+                return
+            keys = self._user_keys(user_id, middle_name, first_name, last_name)
+            mask, institute = (entry[1], entry[2]) if entry else (0, None)
+            self._users[user_id] = [
+                " ".join((middle_name, first_name, last_name)),
+                mask,
+                institute,
+                keys,
+            ]
+            for key in keys:
+                insort(self._keys, key)
+
+    def remove_user(self, user_id):
+        if not self.built:
+            return
+        with self._lock:
+            entry = self._users.pop(user_id, None)
+            if entry is not None:
+                self._remove_keys(entry[3])
+
+    def set_institute(self, user_id, institute):
+        with self._lock:
+            if user_id in self._users:
+                self._users[user_id][2] = institute
+
+    def change_roles(self, user_id, add=(), remove=(), clear=False):
+        with self._lock:
+            entry = self._users.get(user_id)
+            if entry is not None:
+                mask = 0 if clear else entry[1] & ~role_mask(remove)
+                entry[1] = mask | role_mask(add)
+
+    def search(
+        self, query: str, role=None, institute=None, limit=10, max_scan=5000
+    ):
+        """
+        ``(user id, fullname)`` of the users whose name starts with
+        ``query``, in name order.
+        """
+        prefix = normalize(query)[:KEY_LENGTH]
+        if not prefix:
+            return []
+        self.sync()
+        role_bit = 1 << role if role is not None else 0
+
+        results = []
+        seen = set()
+        with self._lock:
+            start = bisect_left(self._keys, prefix)
+            for key in self._keys[start : start + max_scan]:
+                if not key.startswith(prefix):
+                    break
+                user_id = int(key.rpartition(SEPARATOR)[2])
+                fullname, mask, user_institute, _ = self._users[user_id]
+                if user_id in seen or (role_bit and not mask & role_bit):
+                    continue
+                if institute is not None and user_institute != institute:
+                    continue
+                seen.add(user_id)
+                results.append((user_id, fullname))
+                if len(results) >= limit:
+                    break
+        return results
+
+
+index = NameIndex()
+
+
+def _initial_version():
+    # random, so a version lost from the cache does not restart at one
+    # some process already has
+    return uuid.uuid4().int >> 80
+
+
+def invalidate():
+    """
+    Increment the version, so every process rebuilds its index on its
+    next sync. Return the new version, None when it was lost meanwhile.
+    """
+    cache.add(VERSION_KEY, _initial_version(), None)
+    try:
+        return cache.incr(VERSION_KEY)
+    except ValueError:
+        return None
+
+
+def publish(change):
+    """
+    Once the transaction commits, increment the version and apply
+    ``change(index)`` to the index of this process.
+    """
+
+    def commit():
+        index.apply(change, invalidate())
+
+    transaction.on_commit(commit)
+
+
+def build_on_startup():
+    if getattr(settings, "AUTOCOMPLETE_BUILD_ON_STARTUP", False):
+        threading.Thread(
+            target=index.build, name="autocomplete-build", daemon=True
+        ).start()
+
+
+@receiver(post_save, sender=CustomUser)
+def changing_user(sender, instance: CustomUser, created=False, **kwargs):
+    # e.g. the last_login and telegram_id updates do not touch the index
+    if not created and not instance.names_changed():
+        return
+    user = (
+        instance.pk,
+        instance.middle_name,
+        instance.first_name,
+        instance.last_name,
+        instance.is_active,
+    )
+    publish(lambda index: index.update_user(*user))
+
+
+@receiver(post_delete, sender=CustomUser)
+def deleting_user(sender, instance: CustomUser, **kwargs):
+    user_id = instance.pk
+    publish(lambda index: index.remove_user(user_id))
+
+
+@receiver(post_save, sender=UserProfile)
+def changing_profile(sender, instance: UserProfile, created=False, **kwargs):
+    if created or instance.institute_changed():
+        user_id, institute = instance.user_id, instance.institute_id
+        publish(lambda index: index.set_institute(user_id, institute))
+
+
+@receiver(m2m_changed, sender=CustomUser.roles.through)
+def changing_user_roles(sender, instance, action, reverse, pk_set, **kwargs):
+    if action not in ("post_add", "post_remove", "post_clear"):
+        return
+    if action == "post_clear" and reverse:
+        # the users of the role are unknown, rebuilt from the database
+        transaction.on_commit(invalidate)
+        return
+    pk_set = set(pk_set or ())
+    if reverse:
+        # the users added to or removed from the role
+        roles = {instance.pk}
+
+        def change(index):
+            for user_id in pk_set:
+                index.change_roles(
+                    user_id,
+                    add=roles if action == "post_add" else (),
+                    remove=roles if action == "post_remove" else (),
+                )
+
+    else:
+        user_id = instance.pk
+
+        def change(index):
+            index.change_roles(
+                user_id,
+                add=pk_set if action == "post_add" else (),
+                remove=pk_set if action == "post_remove" else (),
+                clear=action == "post_clear",
+            )
+
+    publish(change)
@@ -0,0 +1,29 @@
+from django.contrib.auth.backends import ModelBackend
+
+from authentication.models import CustomUser
+
+
+class RoleAwareModelBackend(ModelBackend):
+    """
+    ModelBackend that loads the user together with its roles in one
+    query, so the token payload needs no further queries.
+
+        AUTHENTICATION_BACKENDS = [
+            "authentication.backends.RoleAwareModelBackend",
+        ]
+    """
+
+    def authenticate(self, request, username=None, password=None, **kwargs):
+        if username is None:
+            username = kwargs.get(CustomUser.USERNAME_FIELD)
+        if username is None or password is None:
+            return None
+        user = CustomUser.get_with_roles(username)
+        if user is None:
+            # Run the default password hasher once to reduce the timing
+            # difference between an existing and a nonexistent user.
+            CustomUser().set_password(password)
+            return None
+        if user.check_password(password) and self.user_can_authenticate(user):
+            return user
+        return None
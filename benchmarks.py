@@ -0,0 +1,716 @@
+import asyncio
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+import tracemalloc
+from pathlib import Path
+
+from asgiref.sync import ThreadSensitiveContext, async_to_sync
+from django.contrib import admin
+from django.contrib.auth.hashers import get_hasher
+from django.db import connection, transaction
+from django.db.models import Count
+from django.test import AsyncRequestFactory, override_settings
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIRequestFactory, force_authenticate
+from rest_framework.views import APIView
+from rest_framework_jwt.settings import api_settings
+from rest_framework_jwt.views import obtain_jwt_token
+
+from authentication import (
+    async_views,
+    autocomplete,
+    custom_jwt_payload,
+    datagen,
+    views,
+)
+from authentication.models import (
+    CustomUser,
+    Department,
+    Role,
+    StudentProfile,
+    UserProfile,
+)
+from authentication.permissions import IsDeccan, IsEmployee
+from authentication.permisson_classes import ApiClient
+from authentication.serializers import (
+    UserProfileSerializer,
+    UserProfileValuesSerializer,
+    UserSerializer,
+    UserValuesSerializer,
+)
+from authentication.throttling import LoginRateThrottle
+
+# the query counts are committed, latency and memory depend on the
+# machine and are kept next to them, out of version control
+BASELINE_PATH = Path(__file__).with_name("bench_baseline.json")
+MACHINE_BASELINE_PATH = BASELINE_PATH.with_suffix(".local.json")
+MACHINE_METRICS = ("p95", "memory_kib")
+BENCH_USERNAME = "bench-staff"
+
+SCENARIOS = {}
+
+
+def scenario(name):
+    def decorator(func):
+        SCENARIOS[name] = func
+        return func
+
+    return decorator
+
+
+def measure(func, repeat: int = 20, warmup: int = 2) -> dict:
+    """
+    Run ``func`` ``repeat`` times and return the number of queries of a
+    single call, latency percentiles in milliseconds and the peak
+    python memory allocated by a single call in KiB.
+    """
+    for _ in range(warmup):
+        func()
+
+    with CaptureQueriesContext(connection) as ctx:
+        func()
+    queries = len(ctx.captured_queries)
+
+    tracemalloc.start()
+    try:
+        func()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        timings.append((time.perf_counter() - start) * 1000)
+    percentiles = statistics.quantiles(timings, n=100, method="inclusive")
+    return {
+        "queries": queries,
+        "p50": round(percentiles[49], 3),
+        "p95": round(percentiles[94], 3),
+        "p99": round(percentiles[98], 3),
+        "memory_kib": round(peak / 1024, 1),
+    }
+
+
+def _call(view, request, user=None, **kwargs):
+    if user is not None:
+        force_authenticate(request, user=user)
+    response = view(request, **kwargs)
+    if hasattr(response, "render"):
+        response.render()
+    assert response.status_code < 400, (
+        response.status_code,
+        getattr(response, "data", None),
+    )
+    return response
+
+
+def bench_employee(template: CustomUser) -> CustomUser:
+    """
+    The staff employee the scenarios run as: a dedicated user named
+    like ``template`` in its department, so that no generated or real
+    user is made staff or gets its password reset.
+    """
+    user, created = CustomUser.objects.get_or_create(
+        username=BENCH_USERNAME,
+        defaults={
+            "password": template.password,
+            "middle_name": template.middle_name,
+            "first_name": template.first_name,
+            "last_name": template.last_name,
+            "is_staff": True,
+        },
+    )
+    if created:
+        user.roles.add(Role.EMPLOYEE)
+        UserProfile.objects.filter(user=user).update(
+            work_department=template.userprofile.work_department_id
+        )
+    return CustomUser.objects.select_related("userprofile").get(pk=user.pk)
+
+
+class Context:
+    def __init__(self, password: str):
+        self.factory = APIRequestFactory()
+        self.password = password
+        users = CustomUser.objects.filter(
+            username__startswith=datagen.USERNAME_PREFIX
+        )
+        self.employee = bench_employee(
+            users.filter(roles=Role.EMPLOYEE)
+            .exclude(userprofile__work_department=None)
+            .select_related("userprofile")
+            .first()
+        )
+        self.student = StudentProfile.objects.filter(
+            user__username__startswith=datagen.USERNAME_PREFIX
+        ).first()
+        self.department = Department.objects.get(
+            pk=self.employee.userprofile.work_department_id
+        )
+        self.groups = list(
+            StudentProfile.objects.exclude(group=None)
+            .values_list("group", flat=True)
+            .distinct()
+            .order_by("group")[:2]
+        )
+
+
+@scenario("token_issue")
+def token_issue(ctx: Context):
+    data = {"username": ctx.employee.username, "password": ctx.password}
+    return lambda: _call(obtain_jwt_token, ctx.factory.post("/token/", data))
+
+
+@scenario("token_check")
+def token_check(ctx: Context):
+    """Decoding of a token with the revocation check."""
+    token = api_settings.JWT_ENCODE_HANDLER(
+        custom_jwt_payload.jwt_payload_handler(ctx.employee)
+    )
+    return lambda: custom_jwt_payload.jwt_decode_handler(token)
+
+
+@scenario("role_checks")
+def role_checks(ctx: Context):
+    view = views.GetRoles.as_view()
+
+    def run():
+        request = ctx.factory.get("/roles/")
+        request.user = CustomUser.objects.get(pk=ctx.employee.pk)
+        IsEmployee().has_permission(request, None)
+        IsDeccan().has_permission(request, None)
+        _call(view, request, request.user)
+
+    return run
+
+
+@scenario("profile_list")
+def profile_list(ctx: Context):
+    view = views.ListUserProfilesBy.as_view()
+    return lambda: _call(view, ctx.factory.get("/profiles/"), ctx.employee)
+
+
+@scenario("profile_search")
+def profile_search(ctx: Context):
+    view = views.ListUserProfilesBy.as_view()
+    name = ctx.employee.middle_name[:4]
+    return lambda: _call(
+        view, ctx.factory.get("/profiles/", {"name": name}), ctx.employee
+    )
+
+
+@scenario("profile_stats")
+def profile_stats(ctx: Context):
+    view = views.GetUserProfileStats.as_view()
+    return lambda: _call(
+        view, ctx.factory.get("/profiles-stats/"), ctx.employee
+    )
+
+
+@scenario("users_list")
+def users_list(ctx: Context):
+    view = views.UsersList.as_view()
+    return lambda: _call(
+        view,
+        ctx.factory.get(f"/departments/{ctx.department.pk}/users/"),
+        ctx.employee,
+        pk=ctx.department.pk,
+    )
+
+
+@scenario("group_transfer")
+def group_transfer(ctx: Context):
+    groups = ctx.groups
+
+    def run():
+        profile = StudentProfile.objects.get(pk=ctx.student.pk)
+        profile.group_id = (
+            groups[1] if profile.group_id == groups[0] else groups[0]
+        )
+        profile.save()
+
+    return run
+
+
+def _admin_changelist(ctx: Context, model, params=None):
+    # never saved, the changelist only asks it for permissions
+    superuser = CustomUser(
+        username="bench-admin", is_staff=True, is_superuser=True
+    )
+    model_admin = admin.site._registry[model]
+
+    def run():
+        request = ctx.factory.get("/admin/", params or {})
+        request.user = superuser
+        response = model_admin.changelist_view(request)
+        response.render()
+        assert response.status_code == 200, response.status_code
+
+    return run
+
+
+@scenario("admin_users")
+def admin_users(ctx: Context):
+    return _admin_changelist(ctx, CustomUser)
+
+
+@scenario("admin_users_search")
+def admin_users_search(ctx: Context):
+    return _admin_changelist(
+        ctx,
+        CustomUser,
+        {"q": ctx.employee.middle_name[:4], "role": Role.EMPLOYEE},
+    )
+
+
+@scenario("admin_profiles")
+def admin_profiles(ctx: Context):
+    return _admin_changelist(ctx, UserProfile)
+
+
+@scenario("admin_students")
+def admin_students(ctx: Context):
+    return _admin_changelist(ctx, StudentProfile)
+
+
+@scenario("user_contracts")
+def user_contracts(ctx: Context):
+    """
+    First page of the contracts of the user with most of them, the
+    generator gives one teacher 10 years of contracts.
+    """
+    user = (
+        CustomUser.objects.lean()
+        .annotate(contracts=Count("effectivecontract"))
+        .order_by("-contracts")
+        .first()
+    )
+    view = views.UserEffectiveContractsList.as_view()
+    return lambda: _call(
+        view,
+        ctx.factory.get(f"/users/{user.pk}/contracts/", {"page": 1}),
+        ctx.employee,
+        pk=user.pk,
+    )
+
+
+@scenario("autocomplete")
+def autocomplete_lookup(ctx: Context):
+    index = autocomplete.NameIndex()
+    index.build()
+    prefixes = [
+        ctx.employee.middle_name[:length] for length in (1, 2, 4)
+    ] + [ctx.employee.first_name[:3]]
+    teacher = autocomplete.ROLE_IDS["teacher"]
+
+    def run():
+        for prefix in prefixes:
+            index.search(prefix)
+            index.search(prefix, role=teacher)
+
+    return run
+
+
+def autocomplete_build() -> dict:
+    """Build time and memory of the autocomplete index."""
+    index = autocomplete.NameIndex()
+    tracemalloc.start()
+    try:
+        start = time.perf_counter()
+        index.build()
+        elapsed = time.perf_counter() - start
+        memory, _ = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return {
+        "users": len(index),
+        "build_seconds": round(elapsed, 3),
+        "memory_mib": round(memory / 2**20, 1),
+    }
+
+
+def hr_sync(rows: int = 10_000) -> dict:
+    """
+    Rows per second of ``profiles/sync/`` for a batch of the generated
+    profiles, every other one changed. The changes are rolled back.
+    """
+    profiles = UserProfile.objects.filter(
+        user__username__startswith=datagen.USERNAME_PREFIX
+    ).values_list("user__username", "position")[:rows]
+    batch = [
+        {
+            "username": username,
+            "position": position if n % 2 else f"{position or ''} (HR)",
+            "academic_degree": None,
+        }
+        for n, (username, position) in enumerate(profiles)
+    ]
+    request = APIRequestFactory().post("/profiles/sync/", batch, format="json")
+    force_authenticate(request, token=ApiClient("bench", ["hr"]))
+
+    with transaction.atomic():
+        with CaptureQueriesContext(connection) as queries:
+            start = time.perf_counter()
+            response = _call(views.HrProfileSyncView.as_view(), request)
+            elapsed = time.perf_counter() - start
+        transaction.set_rollback(True)
+
+    statuses = {}
+    for result in response.data:
+        statuses[result["status"]] = statuses.get(result["status"], 0) + 1
+    return {
+        "rows": len(batch),
+        "seconds": round(elapsed, 3),
+        "rows_per_sec": round(len(batch) / elapsed, 1),
+        "queries": len(queries.captured_queries),
+        "statuses": statuses,
+    }
+
+
+def serialization_cpu(repeat: int = 5) -> dict:
+    """
+    CPU milliseconds to load and serialize the generated profiles and
+    users with the DRF serializers and with their values twins.
+    """
+    context = {"request": APIRequestFactory().get("/profiles/")}
+    profiles = UserProfile.objects.filter(
+        user__username__startswith=datagen.USERNAME_PREFIX
+    ).order_by("pk")
+    users = (
+        CustomUser.objects.lean()
+        .filter(username__startswith=datagen.USERNAME_PREFIX)
+        .order_by("pk")
+    )
+    cases = {
+        "profiles": (
+            profiles,
+            lambda: UserProfileSerializer(
+                profiles.all(), many=True, context=context
+            ).data,
+            lambda: UserProfileValuesSerializer(
+                UserProfileValuesSerializer.values(profiles), context=context
+            ).data,
+        ),
+        "users": (
+            users,
+            lambda: UserSerializer(users.all(), many=True).data,
+            lambda: UserValuesSerializer(
+                UserValuesSerializer.values(users)
+            ).data,
+        ),
+    }
+
+    results = {}
+    for name, (queryset, *paths) in cases.items():
+        timings = []
+        for func in paths:
+            func()
+            start = time.process_time()
+            for _ in range(repeat):
+                func()
+            timings.append((time.process_time() - start) * 1000 / repeat)
+        results[name] = {
+            "rows": queryset.count(),
+            "drf_ms": round(timings[0], 3),
+            "values_ms": round(timings[1], 3),
+            "speedup": round(timings[0] / max(timings[1], 1e-9), 1),
+        }
+    return results
+
+
+@scenario("rate_limiter")
+def rate_limiter(ctx: Context):
+    """
+    Overhead of the login throttle alone; every call comes from a fresh
+    address and username so the limits are never reached.
+    """
+    throttle = LoginRateThrottle()
+    counter = iter(range(10**9))
+
+    def run():
+        n = next(counter)
+        request = ctx.factory.post(
+            "/token/",
+            {"username": f"bench{n}"},
+            format="json",
+            REMOTE_ADDR=f"10.{n >> 16 & 255}.{n >> 8 & 255}.{n & 255}",
+        )
+        request = APIView().initialize_request(request)
+        assert throttle.allow_request(request, None)
+
+    return run
+
+
+def run_suite(
+    password: str = "password",
+    names=None,
+    repeat: int = 20,
+    warmup: int = 2,
+) -> dict:
+    ctx = Context(password)
+    return {
+        name: measure(factory(ctx), repeat=repeat, warmup=warmup)
+        for name, factory in SCENARIOS.items()
+        if names is None or name in names
+    }
+
+
+def token_throughput(
+    password: str = "password",
+    total: int = 200,
+    iterations: int = None,
+    backend: str = "authentication.backends.RoleAwareModelBackend",
+) -> dict:
+    """
+    Tokens per second issued by ``token/`` for one user, password
+    hashing included. ``iterations`` sets the PBKDF2 work factor.
+    """
+    overrides = {
+        "AUTHENTICATION_BACKENDS": [backend],
+        "PASSWORD_HASHERS": [
+            "authentication.hashers.ConfigurablePBKDF2PasswordHasher"
+        ],
+    }
+    if iterations is not None:
+        overrides["PASSWORD_HASHER_ITERATIONS"] = iterations
+    with override_settings(**overrides):
+        ctx = Context(password)
+        ctx.employee.set_password(password)
+        ctx.employee.save(update_fields=["password"])
+        run = token_issue(ctx)
+
+        with CaptureQueriesContext(connection) as queries:
+            run()
+        start = time.perf_counter()
+        for _ in range(total):
+            run()
+        elapsed = time.perf_counter() - start
+        return {
+            "tokens_per_sec": round(total / elapsed, 1),
+            "queries": len(queries.captured_queries),
+            "iterations": get_hasher().iterations,
+        }
+
+
+def jwt_header(user) -> str:
+    token = api_settings.JWT_ENCODE_HANDLER(
+        api_settings.JWT_PAYLOAD_HANDLER(user)
+    )
+    return f"{api_settings.JWT_AUTH_HEADER_PREFIX} {token}"
+
+
+def load_targets(ctx: Context) -> dict:
+    """
+    Sync and async implementations of the same endpoint:
+    ``name: (sync view, async view, path, view kwargs)``.
+    """
+    pk = ctx.employee.pk
+    return {
+        "roles": (
+            views.GetRoles.as_view(),
+            async_views.get_roles,
+            "/roles/",
+            {},
+        ),
+        "institutes": (
+            views.InstituteList.as_view(),
+            async_views.institute_list,
+            "/institutes/",
+            {},
+        ),
+        "profile": (
+            views.GetUserProfiles.as_view(),
+            async_views.get_user_profile,
+            f"/profile/{pk}/",
+            {"pk": pk},
+        ),
+        "profile_stats": (
+            views.GetUserProfileStats.as_view(),
+            async_views.get_user_profile_stats,
+            "/profiles-stats/",
+            {},
+        ),
+    }
+
+
+async def _async_load(view, path, kwargs, header, total, concurrency):
+    factory = AsyncRequestFactory()
+    remaining = iter(range(total))
+
+    async def worker():
+        for _ in remaining:
+            # a fresh context per request, like the ASGI handler does
+            async with ThreadSensitiveContext():
+                request = factory.get(path, HTTP_AUTHORIZATION=header)
+                response = await view(request, **kwargs)
+            assert response.status_code < 400, response.status_code
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return total / (time.perf_counter() - start)
+
+
+def load_test(
+    password: str = "password",
+    names=None,
+    total: int = 500,
+    concurrency: int = 20,
+) -> dict:
+    """
+    Requests per second a single worker serves for the sync views
+    (one request at a time) and for their async variants
+    (``concurrency`` requests in flight on one event loop).
+    """
+    ctx = Context(password)
+    header = jwt_header(ctx.employee)
+    results = {}
+    for name, target in load_targets(ctx).items():
+        if names is not None and name not in names:
+            continue
+        sync_view, async_view, path, kwargs = target
+
+        start = time.perf_counter()
+        for _ in range(total):
+            request = ctx.factory.get(path, HTTP_AUTHORIZATION=header)
+            _call(sync_view, request, **kwargs)
+        sync_rps = total / (time.perf_counter() - start)
+
+        async_rps = async_to_sync(_async_load)(
+            async_view, path, kwargs, header, total, concurrency
+        )
+        results[name] = {
+            "sync_rps": round(sync_rps, 1),
+            "async_rps": round(async_rps, 1),
+        }
+    return results
+
+
+# a worker boot: django.setup() and the URLconf
+IMPORT_BUDGET_MS = 1500
+IMPORT_MARKER = "-- startup ms --"
+IMPORT_SCRIPT = (
+    "import time; start = time.perf_counter(); "
+    "import importlib, sys, django; django.setup(); "
+    "[importlib.import_module(m) for m in sys.argv[1:]]; "
+    f"print({IMPORT_MARKER!r}, (time.perf_counter() - start) * 1000, "
+    "file=sys.stderr)"
+)
+
+
+def parse_import_times(report: str) -> dict:
+    startup_ms = None
+    modules = {}
+    for line in report.splitlines():
+        if line.startswith(IMPORT_MARKER):
+            startup_ms = float(line[len(IMPORT_MARKER) :])
+        if not line.startswith("import time:"):
+            continue
+        _, cumulative, name = line[len("import time:") :].split("|")
+        try:
+            modules[name.strip()] = int(cumulative)
+        except ValueError:
+            continue  # the header
+    return {"startup_ms": startup_ms, "modules": modules}
+
+
+def import_times(*modules) -> dict:
+    """
+    ``-X importtime`` report of a fresh interpreter running
+    ``django.setup()`` and importing ``modules``: ``startup_ms``, the
+    wall time of both, and the cumulative microseconds of every module
+    imported on the way.
+    """
+    process = subprocess.run(
+        [
+            sys.executable,
+            "-X",
+            "importtime",
+            "-c",
+            IMPORT_SCRIPT,
+            *(modules or ("authentication.urls",)),
+        ],
+        env=os.environ.copy(),
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    return parse_import_times(process.stderr)
+
+
+def _read_json(path: Path) -> dict:
+    if not path.exists():
+        return {}
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def _write_json(data: dict, path: Path):
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(data, f, indent=2, sort_keys=True)
+        f.write("\n")
+
+
+def load_baseline(
+    path: Path = BASELINE_PATH, machine_path: Path = MACHINE_BASELINE_PATH
+) -> dict:
+    """The committed query counts merged with the machine baseline."""
+    baseline = _read_json(path)
+    machine = _read_json(machine_path) if machine_path else {}
+    for name, metrics in machine.items():
+        baseline.setdefault(name, {}).update(metrics)
+    return baseline
+
+
+def save_baseline(
+    results: dict,
+    path: Path = BASELINE_PATH,
+    machine_path: Path = MACHINE_BASELINE_PATH,
+):
+    _write_json(
+        {name: {"queries": r["queries"]} for name, r in results.items()},
+        path,
+    )
+    _write_json(
+        {
+            name: {m: r[m] for m in MACHINE_METRICS if m in r}
+            for name, r in results.items()
+            if any(m in r for m in MACHINE_METRICS)
+        },
+        machine_path,
+    )
+
+
+def compare(
+    results: dict,
+    baseline: dict,
+    tolerance: float = 0.2,
+    metrics=("queries", *MACHINE_METRICS),
+) -> list:
+    """
+    Return the regressions of ``results`` against ``baseline``.
+    A scenario regresses when it runs more queries than the baseline or
+    when its latency or memory grows by more than ``tolerance``; a
+    metric missing from the baseline is reported too.
+    """
+    regressions = []
+    for name, result in results.items():
+        expected = baseline.get(name, {})
+        for metric in metrics:
+            if metric not in expected:
+                regressions.append(f"{name}: no {metric} baseline")
+                continue
+            limit = expected[metric]
+            if metric != "queries":
+                limit *= 1 + tolerance
+            if result[metric] > limit:
+                regressions.append(
+                    f"{name}: {metric} {result[metric]},"
+                    f" baseline {expected[metric]}"
+                )
+    return regressions
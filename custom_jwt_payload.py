@@ -1,7 +1,33 @@
+import uuid
+from calendar import timegm
+from datetime import datetime
+
+import jwt
+from rest_framework_jwt import utils
+
+from authentication.revocation import revocations
+
+
+def jwt_payload_handler(user):
+    payload = utils.jwt_payload_handler(user)
+    # jti identifies the token, iat dates it for the revocation of users
+    payload["jti"] = uuid.uuid4().hex
+    payload["iat"] = timegm(datetime.utcnow().utctimetuple())
+    return payload
+
+
+def jwt_decode_handler(token):
+    payload = utils.jwt_decode_handler(token)
+    if revocations.is_revoked(payload):
+        raise jwt.InvalidTokenError("Token has been revoked")
+    return payload
+
+
 def jwt_response_payload_handler(token, user=None, *args, **kwargs):
+    full_name = user.fio()
     return {
         "token": token,
         "user_id": user.id,
         "role": user.get_roles_str(),
-        "full_name": user.fio() if user.fio() != "  " else "",
+        "full_name": full_name if full_name != "  " else "",
     }
\ No newline at end of file
@@ -0,0 +1,288 @@
+import random
+
+from django.contrib.auth.hashers import make_password
+from django.db import transaction
+
+from authentication.models import (
+    BrsAdminProfile,
+    CustomUser,
+    Department,
+    Division,
+    EducationDepartment,
+    Institute,
+    Role,
+    StudentProfile,
+    UserProfile,
+)
+from brs.models import Group
+from effective_contract.models import EffectiveContract
+
+MIDDLE_NAMES = (
+    "Иванов",
+    "Петров",
+    "Сидоров",
+    "Смирнов",
+    "Кузнецов",
+    "Попов",
+    "Васильев",
+    "Соколов",
+    "Михайлов",
+    "Новиков",
+    "Федоров",
+    "Морозов",
+)
+FIRST_NAMES = (
+    "Александр",
+    "Дмитрий",
+    "Максим",
+    "Сергей",
+    "Андрей",
+    "Алексей",
+    "Артем",
+    "Илья",
+    "Кирилл",
+    "Михаил",
+)
+LAST_NAMES = (
+    "Александрович",
+    "Дмитриевич",
+    "Сергеевич",
+    "Андреевич",
+    "Алексеевич",
+    "Иванович",
+    "Петрович",
+    "Михайлович",
+)
+POSITIONS = ("Ассистент", "Старший преподаватель", "Доцент", "Профессор")
+
+USERNAME_PREFIX = "gen"
+
+
+def username(number: int) -> str:
+    return f"{USERNAME_PREFIX}{number:07d}"
+
+
+def _bulk_create(model, objs, batch_size):
+    model.objects.bulk_create(objs, batch_size=batch_size)
+
+
+def _created_pks(model, **filters):
+    return list(
+        model._base_manager.filter(**filters)
+        .order_by("pk")
+        .values_list("pk", flat=True)
+    )
+
+
+@transaction.atomic
+def generate_university(
+    users: int = 100_000,
+    students: int = 30_000,
+    teachers: int = 5_000,
+    institutes: int = 10,
+    departments: int = 8,
+    groups: int = 1_000,
+    admins: int = 50,
+    contract_years: int = 10,
+    password: str = "password",
+    batch_size: int = 5_000,
+    seed: int = 0,
+):
+    """
+    Fill the database with a synthetic university: institutes with their
+    departments, study groups, roles and users with profiles.
+
+    The first ``students`` users are students spread over the groups, the
+    next ``teachers`` are teachers, ``admins`` of the rest get the
+    admin/brs_admin/deccan roles and everybody else is an employee.
+    The first teacher gets ``contract_years`` of effective contracts.
+    Signals are bypassed, so profiles are created here explicitly.
+    """
+    assert students + teachers + admins <= users
+    rnd = random.Random(seed)
+
+    Role.objects.bulk_create(
+        [Role(id=role_id) for role_id, _ in Role.ROLE_CHOICES],
+        ignore_conflicts=True,
+    )
+
+    _bulk_create(
+        Institute,
+        [Institute(name=f"Институт {i}") for i in range(institutes)],
+        batch_size,
+    )
+    institute_pks = _created_pks(Institute, name__startswith="Институт ")
+    division = Division.objects.create(name="Сгенерированное подразделение")
+    _bulk_create(
+        Department,
+        [
+            Department(
+                name=f"Отдел {inst}-{i}", institute_id=inst, division=division
+            )
+            for inst in institute_pks
+            for i in range(departments)
+        ],
+        batch_size,
+    )
+    _bulk_create(
+        EducationDepartment,
+        [
+            EducationDepartment(name=f"Кафедра {inst}-{i}", institute_id=inst)
+            for inst in institute_pks
+            for i in range(departments)
+        ],
+        batch_size,
+    )
+    department_pks = _created_pks(Department, division=division)
+    department_institute = dict(
+        Department.objects.filter(pk__in=department_pks).values_list(
+            "pk", "institute_id"
+        )
+    )
+    education_department_institute = dict(
+        EducationDepartment.objects.filter(
+            name__startswith="Кафедра "
+        ).values_list("pk", "institute_id")
+    )
+    education_department_pks = sorted(education_department_institute)
+
+    _bulk_create(
+        Group, [Group(name=f"GEN-{i:05d}") for i in range(groups)], batch_size
+    )
+    group_pks = _created_pks(Group, name__startswith="GEN-")
+
+    hashed = make_password(password)
+    _bulk_create(
+        CustomUser,
+        [
+            CustomUser(
+                username=username(i),
+                password=hashed,
+                middle_name=rnd.choice(MIDDLE_NAMES),
+                first_name=rnd.choice(FIRST_NAMES),
+                last_name=rnd.choice(LAST_NAMES),
+            )
+            for i in range(users)
+        ],
+        batch_size,
+    )
+    user_pks = _created_pks(
+        CustomUser, username__startswith=USERNAME_PREFIX
+    )
+
+    admin_roles = (Role.ADMIN, Role.BRS_ADMIN, Role.DECCAN)
+    user_roles = []
+    for index, user_pk in enumerate(user_pks):
+        if index < students:
+            user_roles.append((user_pk, Role.STUDENT))
+        elif index < students + teachers:
+            user_roles.append((user_pk, Role.TEACHER))
+        else:
+            user_roles.append((user_pk, Role.EMPLOYEE))
+            if index < students + teachers + admins:
+                user_roles.append((user_pk, rnd.choice(admin_roles)))
+
+    Through = CustomUser.roles.through
+    _bulk_create(
+        Through,
+        [Through(customuser_id=u, role_id=r) for u, r in user_roles],
+        batch_size,
+    )
+    _bulk_create(
+        BrsAdminProfile,
+        [
+            BrsAdminProfile(user_id=user_pk)
+            for user_pk, role_id in user_roles
+            if role_id in (Role.BRS_ADMIN, Role.DECCAN)
+        ],
+        batch_size,
+    )
+
+    _bulk_create(
+        StudentProfile,
+        [
+            StudentProfile(
+                user_id=user_pk,
+                number_id=f"{index:08d}",
+                group_id=group_pks[index % len(group_pks)],
+            )
+            for index, user_pk in enumerate(user_pks[:students])
+        ],
+        batch_size,
+    )
+
+    profiles = []
+    for index, user_pk in enumerate(user_pks[students:]):
+        if index < teachers:
+            education_department = rnd.choice(education_department_pks)
+            profiles.append(
+                UserProfile(
+                    user_id=user_pk,
+                    education_department_id=education_department,
+                    institute_id=education_department_institute[
+                        education_department
+                    ],
+                    position=rnd.choice(POSITIONS),
+                )
+            )
+        else:
+            department = rnd.choice(department_pks)
+            profiles.append(
+                UserProfile(
+                    user_id=user_pk,
+                    work_department_id=department,
+                    division=division,
+                    institute_id=department_institute[department],
+                )
+            )
+    _bulk_create(UserProfile, profiles, batch_size)
+
+    if teachers and contract_years:
+        generate_contracts(
+            user_pks[students], years=contract_years, batch_size=batch_size
+        )
+
+    return {
+        "institutes": len(institute_pks),
+        "departments": len(department_pks),
+        "groups": len(group_pks),
+        "users": len(user_pks),
+        "students": students,
+        "teachers": teachers,
+        "employees": users - students - teachers,
+    }
+
+
+def generate_contracts(
+    user_pk,
+    years: int = 10,
+    per_year: int = 2,
+    items: int = 20,
+    batch_size: int = 5_000,
+) -> int:
+    """
+    Give the user ``per_year`` effective contracts a year for ``years``
+    years, each with ``items`` items. Return the number of contracts.
+    """
+    user_field = CustomUser._meta.get_field("effectivecontract").field
+    item_field = EffectiveContract._meta.get_field(
+        "effectivecontractitem"
+    ).field
+    Item = item_field.model
+    TypeOfWork = Item._meta.get_field("type_of_work").related_model
+    type_of_work = TypeOfWork.objects.first() or TypeOfWork.objects.create()
+
+    contracts = [
+        EffectiveContract.objects.create(**{user_field.attname: user_pk})
+        for _ in range(years * per_year)
+    ]
+    _bulk_create(
+        Item,
+        [
+            Item(**{item_field.name: contract, "type_of_work": type_of_work})
+            for contract in contracts
+            for _ in range(items)
+        ],
+        batch_size,
+    )
+    return len(contracts)
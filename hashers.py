@@ -0,0 +1,18 @@
+from django.conf import settings
+from django.contrib.auth.hashers import PBKDF2PasswordHasher
+
+
+class ConfigurablePBKDF2PasswordHasher(PBKDF2PasswordHasher):
+    """
+    PBKDF2 with the work factor taken from
+    ``settings.PASSWORD_HASHER_ITERATIONS``, for tests and benchmarks.
+    Hashes stay compatible with the default ``pbkdf2_sha256`` hasher.
+    """
+
+    @property
+    def iterations(self):
+        return getattr(
+            settings,
+            "PASSWORD_HASHER_ITERATIONS",
+            PBKDF2PasswordHasher.iterations,
+        )
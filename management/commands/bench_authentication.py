@@ -0,0 +1,130 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from authentication import benchmarks
+
+
+class Command(BaseCommand):
+    help = (
+        "Run the authentication benchmarks against generated data "
+        "and compare them with the stored baseline"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("scenarios", nargs="*")
+        parser.add_argument("--password", default="password")
+        parser.add_argument("--repeat", type=int, default=20)
+        parser.add_argument("--tolerance", type=float, default=0.2)
+        parser.add_argument("--update-baseline", action="store_true")
+        parser.add_argument(
+            "--load",
+            action="store_true",
+            help="Compare requests/sec of the sync and async views",
+        )
+        parser.add_argument("--concurrency", type=int, default=20)
+        parser.add_argument(
+            "--autocomplete",
+            action="store_true",
+            help="Measure build time and memory of the autocomplete index",
+        )
+        parser.add_argument(
+            "--hr-sync",
+            type=int,
+            nargs="?",
+            const=10_000,
+            metavar="ROWS",
+            help="Measure rows/sec of the HR profile sync",
+        )
+        parser.add_argument(
+            "--serializers",
+            action="store_true",
+            help="Compare CPU time of the DRF and values serializers",
+        )
+        parser.add_argument(
+            "--imports",
+            action="store_true",
+            help="Report import times of the given modules",
+        )
+        parser.add_argument(
+            "--tokens",
+            action="store_true",
+            help="Measure tokens/sec of the token endpoint",
+        )
+        parser.add_argument(
+            "--iterations",
+            type=int,
+            help="PBKDF2 work factor used with --tokens",
+        )
+
+    def handle(self, *args, **options):
+        if options["autocomplete"]:
+            results = benchmarks.autocomplete_build()
+            self.stdout.write(json.dumps(results, indent=2))
+            return
+
+        if options["hr_sync"]:
+            results = benchmarks.hr_sync(options["hr_sync"])
+            self.stdout.write(json.dumps(results, indent=2))
+            return
+
+        if options["serializers"]:
+            results = benchmarks.serialization_cpu(options["repeat"])
+            self.stdout.write(json.dumps(results, indent=2))
+            return
+
+        if options["imports"]:
+            times = benchmarks.import_times(*options["scenarios"])
+            for name, cumulative in sorted(
+                times["modules"].items(),
+                key=lambda item: item[1],
+                reverse=True,
+            ):
+                self.stdout.write(f"{cumulative / 1000:10.1f} ms  {name}")
+            self.stdout.write(f"{times['startup_ms']:10.1f} ms  startup")
+            return
+
+        if options["tokens"]:
+            results = benchmarks.token_throughput(
+                password=options["password"],
+                total=options["repeat"] * 10,
+                iterations=options["iterations"],
+            )
+            self.stdout.write(json.dumps(results, indent=2))
+            return
+
+        if options["load"]:
+            results = benchmarks.load_test(
+                password=options["password"],
+                names=options["scenarios"] or None,
+                total=options["repeat"] * 25,
+                concurrency=options["concurrency"],
+            )
+            self.stdout.write(json.dumps(results, indent=2))
+            return
+
+        results = benchmarks.run_suite(
+            password=options["password"],
+            names=options["scenarios"] or None,
+            repeat=options["repeat"],
+        )
+        self.stdout.write(json.dumps(results, indent=2))
+
+        if options["update_baseline"]:
+            baseline = benchmarks.load_baseline()
+            baseline.update(results)
+            benchmarks.save_baseline(baseline)
+            self.stdout.write(
+                self.style.SUCCESS(
+                    f"Saved {benchmarks.BASELINE_PATH} and "
+                    f"{benchmarks.MACHINE_BASELINE_PATH}"
+                )
+            )
+            return
+
+        regressions = benchmarks.compare(
+            results, benchmarks.load_baseline(), options["tolerance"]
+        )
+        if regressions:
+            raise CommandError("\n".join(regressions))
+        self.stdout.write(self.style.SUCCESS("No regressions"))
@@ -0,0 +1,23 @@
+import json
+
+from django.core.management.base import BaseCommand
+
+from authentication import snapshot
+
+
+class Command(BaseCommand):
+    help = "Write the user/role/department directory snapshot file"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--path", help="Defaults to settings.DIRECTORY_SNAPSHOT_PATH"
+        )
+        parser.add_argument(
+            "--full",
+            action="store_true",
+            help="Rebuild instead of updating the previous snapshot",
+        )
+
+    def handle(self, *args, **options):
+        result = snapshot.write_snapshot(options["path"], options["full"])
+        self.stdout.write(json.dumps(result, indent=2))
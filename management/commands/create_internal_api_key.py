@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand
+
+from authentication.models import InternalApiKey
+
+
+class Command(BaseCommand):
+    help = "Issue an internal API key for a service and print it once"
+
+    def add_arguments(self, parser):
+        parser.add_argument("service")
+        parser.add_argument(
+            "--scope",
+            action="append",
+            default=[],
+            dest="scopes",
+            help=f"Repeatable, {InternalApiKey.ALL_SCOPES!r} allows all",
+        )
+
+    def handle(self, *args, **options):
+        _, key = InternalApiKey.issue(options["service"], options["scopes"])
+        self.stdout.write(key)
@@ -0,0 +1,31 @@
+from django.core.management.base import BaseCommand
+
+from authentication import datagen
+
+
+class Command(BaseCommand):
+    help = "Fill the database with a synthetic university for benchmarks"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--users", type=int, default=100_000)
+        parser.add_argument("--students", type=int, default=30_000)
+        parser.add_argument("--teachers", type=int, default=5_000)
+        parser.add_argument("--institutes", type=int, default=10)
+        parser.add_argument("--departments", type=int, default=8)
+        parser.add_argument("--groups", type=int, default=1_000)
+        parser.add_argument("--password", default="password")
+        parser.add_argument("--seed", type=int, default=0)
+
+    def handle(self, *args, **options):
+        created = datagen.generate_university(
+            users=options["users"],
+            students=options["students"],
+            teachers=options["teachers"],
+            institutes=options["institutes"],
+            departments=options["departments"],
+            groups=options["groups"],
+            password=options["password"],
+            seed=options["seed"],
+        )
+        for name, count in created.items():
+            self.stdout.write(f"{name}: {count}")
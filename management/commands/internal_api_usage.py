@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand
+
+from authentication.models import InternalApiKey
+from authentication.permisson_classes import usage
+
+
+class Command(BaseCommand):
+    help = "Show requests and average latency per internal service"
+
+    def handle(self, *args, **options):
+        services = set(
+            InternalApiKey.objects.values_list("service", flat=True)
+        )
+        services.add("default")
+        stats = usage.get(services)
+        for service, counters in sorted(
+            stats.items(), key=lambda item: item[1]["requests"], reverse=True
+        ):
+            self.stdout.write(
+                f"{service:30} {counters['requests']:10} requests "
+                f"{counters['avg_ms']:10} ms avg"
+            )
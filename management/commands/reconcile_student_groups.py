@@ -0,0 +1,81 @@
+import time
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+from authentication import reconcile
+from authentication.models import StudentProfile
+
+
+class Command(BaseCommand):
+    help = (
+        "Recreate missing and delete stale GradeSum/JournalLog rows "
+        "of students, group by group"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("groups", nargs="*", type=int)
+        parser.add_argument("--dry-run", action="store_true")
+        parser.add_argument(
+            "--workers",
+            type=int,
+            default=4,
+            help="Processes to use, 0 reconciles in this process",
+        )
+        parser.add_argument("--progress-every", type=int, default=50)
+
+    def handle(self, *args, **options):
+        groups = options["groups"] or list(
+            StudentProfile.objects.exclude(group=None)
+            .order_by("group_id")
+            .values_list("group_id", flat=True)
+            .distinct()
+        )
+        reconcile_group = partial(
+            reconcile.reconcile_group, dry_run=options["dry_run"]
+        )
+
+        if options["workers"]:
+            # the workers must not share the connections of this process
+            connections.close_all()
+            with ProcessPoolExecutor(
+                options["workers"], initializer=reconcile.init_worker
+            ) as executor:
+                self.report(executor.map(reconcile_group, groups), options)
+        else:
+            self.report(map(reconcile_group, groups), options)
+
+    def report(self, results, options):
+        totals = dict.fromkeys(reconcile.COUNTERS, 0)
+        start = time.perf_counter()
+        done = 0
+        for done, result in enumerate(results, 1):
+            for counter in reconcile.COUNTERS:
+                totals[counter] += result[counter]
+            if options["verbosity"] > 1 and any(
+                result[c] for c in reconcile.COUNTERS[1:]
+            ):
+                self.stdout.write(
+                    " ".join(f"{k}={v}" for k, v in result.items())
+                )
+            if done % options["progress_every"] == 0:
+                self.progress(done, totals, start)
+        self.progress(done, totals, start)
+
+        action = "found" if options["dry_run"] else "fixed"
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"{action}: "
+                + ", ".join(f"{k}={v}" for k, v in totals.items())
+            )
+        )
+
+    def progress(self, done, totals, start):
+        elapsed = time.perf_counter() - start or 1e-9
+        self.stdout.write(
+            f"{done} groups, {totals['students']} students, "
+            f"{done / elapsed:.1f} groups/s, "
+            f"{totals['students'] / elapsed:.1f} students/s"
+        )
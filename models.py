@@ -1,13 +1,19 @@
+import hashlib
+import secrets
+
 from django.apps import apps
+from django.conf import settings
 from django.contrib.auth.models import AbstractUser, UserManager
-from django.db import IntegrityError, models
+from django.core.cache import cache
+from django.db import IntegrityError, models, router, transaction
+from django.db.models import Count
 from django.db.models import Exists as Ex
-from django.db.models import OuterRef
-from django.db.models.signals import m2m_changed
+from django.db.models import OuterRef, Q
+from django.db.models.signals import m2m_changed, post_delete, post_save
 from django.dispatch import receiver
 from rest_framework.exceptions import NotFound
 
-from brs.models import Group
+from authentication import revocation, tasks
 
 
 class Role(models.Model):
@@ -166,6 +172,10 @@ class AcademicTitle(models.Model):
 
 
 class CustomUserManager(UserManager):
+    def lean(self):
+        """Users without the role annotations."""
+        return super().get_queryset()
+
     def get_queryset(self):
         rfilter = Role.objects.filter
         try:
@@ -213,6 +223,17 @@ class CustomUser(AbstractUser):
     is_brs_admin: bool
     is_deccan: bool
 
+    ROLE_FLAGS = {
+        Role.EMPLOYEE: "is_employee",
+        Role.ADMIN: "is_admin",
+        Role.FINANCE: "is_finance",
+        Role.SUPER: "is_super",
+        Role.TEACHER: "is_teacher",
+        Role.STUDENT: "is_student",
+        Role.BRS_ADMIN: "is_brs_admin",
+        Role.DECCAN: "is_deccan",
+    }
+
     DUMR = 1
     UNIR = 2
     UVR = 3
@@ -238,14 +259,56 @@ class CustomUser(AbstractUser):
     )
     objects = CustomUserManager()
 
+    # the fields shown by the name autocomplete
+    NAME_FIELDS = ("middle_name", "first_name", "last_name", "is_active")
+
+    __is_active = None
+    __names = None
+
     class Meta:
         ordering = ("middle_name",)
         verbose_name = "Пользователь"
         verbose_name_plural = "Пользователи"
+        indexes = [
+            # prefix search, the opclasses only take effect on PostgreSQL
+            models.Index(
+                fields=[field],
+                name=f"auth_user_{field}_like",
+                opclasses=["varchar_pattern_ops"],
+            )
+            for field in ("middle_name", "first_name", "last_name")
+        ]
+
+    def __init__(self, *args, **kwargs) -> None:
+        super().__init__(*args, **kwargs)
+        self.__is_active = self.__dict__.get("is_active")
+        self.__names = self._names()
 
     def __str__(self):
         return f"{self.username} | {self.fio()}"
 
+    def save_base(self, *args, **kwargs):
+        deactivated = self.__is_active and not self.__dict__.get(
+            "is_active", True
+        )
+        result = super().save_base(*args, **kwargs)
+        self.__is_active = self.__dict__.get("is_active")
+        self.__names = self._names()
+        if deactivated:
+            pk = self.pk
+            transaction.on_commit(
+                lambda: revocation.revocations.revoke_user(pk)
+            )
+        return result
+
+    def _names(self):
+        # the raw values, so deferred fields are not loaded
+        return tuple(self.__dict__.get(name) for name in self.NAME_FIELDS)
+
+    def names_changed(self) -> bool:
+        """Whether ``NAME_FIELDS`` differ from the loaded or last saved."""
+        return self._names() != self.__names
+
     def fio(self, shorter: bool = False):
         if not shorter:
             return " ".join(
@@ -259,11 +322,38 @@ class CustomUser(AbstractUser):
         return name
 
     def get_roles_str(self):
-        roles = [str(role) for role in self.roles.all()]
+        role_ids = getattr(self, "_role_ids", None)
+        if role_ids is None:
+            roles = [str(role) for role in self.roles.all()]
+        else:
+            role_names = dict(Role.ROLE_CHOICES)
+            roles = [role_names[role_id] for role_id in role_ids]
         if self.admin_dep == CustomUser.DUMR:
             roles.append("dumr")
         return roles
 
+    @classmethod
+    def get_with_roles(cls, username):
+        """
+        Load the user and its roles with a single join instead of the
+        eight role subqueries of the default manager.
+        """
+        db = router.db_for_read(cls)
+        fields = [field.attname for field in cls._meta.concrete_fields]
+        rows = list(
+            cls._base_manager.using(db)
+            .filter(**{cls.USERNAME_FIELD: username})
+            .order_by("roles")
+            .values_list(*fields, "roles")
+        )
+        if not rows:
+            return None
+        user = cls.from_db(db, fields, rows[0][: len(fields)])
+        user._role_ids = [row[-1] for row in rows if row[-1] is not None]
+        for role_id, flag in cls.ROLE_FLAGS.items():
+            setattr(user, flag, role_id in user._role_ids)
+        return user
+
     @classmethod
     def filter_users_by_ec(cls, department, status, istatus, admin_dep):
         _filter = {}
@@ -283,6 +373,51 @@ class CustomUser(AbstractUser):
             **_filter,
         ).distinct()
 
+    @classmethod
+    def filter_audience(
+        cls,
+        roles=None,
+        institute=None,
+        department=None,
+        group=None,
+        ec_status=None,
+    ):
+        """
+        Users matching every given criterion, each user once:
+        the many-valued criteria are subqueries, not joins.
+        """
+        queryset = cls.objects.lean()
+        if roles:
+            queryset = queryset.filter(
+                Ex(
+                    cls.roles.through.objects.filter(
+                        customuser=OuterRef("pk"), role__in=roles
+                    )
+                )
+            )
+        if institute:
+            queryset = queryset.filter(userprofile__institute=institute)
+        if department:
+            queryset = queryset.filter(userprofile__work_department=department)
+        if group:
+            queryset = queryset.filter(studentprofile__group=group)
+        if ec_status:
+            queryset = queryset.filter(
+                pk__in=cls.objects.lean()
+                .filter(effectivecontract__status__in=ec_status)
+                .values("pk")
+            )
+        return queryset
+
+    @classmethod
+    def get_audience_telegram_ids(cls, **spec):
+        return (
+            cls.filter_audience(**spec)
+            .filter(telegram_id__isnull=False)
+            .order_by("telegram_id")
+            .values_list("telegram_id", flat=True)
+        )
+
 
 class AliasUser(models.Model):
     user = models.OneToOneField(CustomUser, models.CASCADE, unique=True)
@@ -307,6 +442,7 @@ class UserProfile(models.Model):
         EducationDepartment, null=True, blank=True, on_delete=models.SET_NULL
     )
     photo = models.ImageField(null=True, blank=True, upload_to="user_photo")
+    photo_variants = models.JSONField(default=dict, blank=True, editable=False)
     position = models.CharField(
         "Должность", max_length=255, null=True, blank=True
     )
@@ -327,13 +463,66 @@ class UserProfile(models.Model):
         "Трудовая деятельность", null=True, blank=True
     )
 
+    # the fields kept in sync with the HR system
+    HR_FIELDS = (
+        "work_department",
+        "position",
+        "academic_degree",
+        "academic_title",
+    )
+
+    __photo = None
+    __institute_id = None
+
     class Meta:
         verbose_name = "Профиль пользователя"
         verbose_name_plural = "Профили пользователей"
 
+    def __init__(self, *args, **kwargs) -> None:
+        super().__init__(*args, **kwargs)
+        self.__photo = self._photo_name()
+        self.__institute_id = self.__dict__.get("institute_id")
+
     def __str__(self) -> str:
         return str(self.user.fio())
 
+    def _photo_name(self):
+        # read the raw value, so a deferred photo is not loaded
+        photo = self.__dict__.get("photo")
+        return getattr(photo, "name", photo) or None
+
+    def institute_changed(self) -> bool:
+        """Whether the institute differs from the loaded or last saved."""
+        return self.__dict__.get("institute_id") != self.__institute_id
+
+    def save_base(self, *args, **kwargs):
+        photo_changed = (
+            "photo" in self.__dict__ and self._photo_name() != self.__photo
+        )
+        if photo_changed and self.photo_variants:
+            variants = self.photo_variants
+            self.photo_variants = {}
+            if kwargs.get("update_fields") is not None:
+                kwargs["update_fields"] = {
+                    *kwargs["update_fields"],
+                    "photo_variants",
+                }
+            transaction.on_commit(
+                lambda: tasks.enqueue(tasks.delete_photo_variants, variants)
+            )
+
+        result = super().save_base(*args, **kwargs)
+        self.__institute_id = self.__dict__.get("institute_id")
+
+        if photo_changed:
+            self.__photo = self._photo_name()
+            if self.photo:
+                pk = self.pk
+                transaction.on_commit(
+                    lambda: tasks.enqueue(tasks.process_photo, pk)
+                )
+        return result
+
     @classmethod
     def get_by_user_or_not_found(cls, user):
         if isinstance(user, (int, str)):
@@ -346,39 +535,130 @@ class UserProfile(models.Model):
             raise NotFound
 
     @classmethod
-    def get_stats(cls):
-        q = UserProfile.objects.filter()
+    def stats_aggregates(cls):
         return {
-            "users_count": q.count(),
-            "empty_any": q.filter(
-                academic_degree__isnull=True,
-                academic_title__isnull=True,
-                awards_achievements="",
-                professional_development="",
-                work_experience="",
-            ).count(),
-            "empty_academic_degree": q.filter(
-                academic_degree__isnull=True
-            ).count(),
-            "empty_academic_title": q.filter(
-                academic_title__isnull=True
-            ).count(),
-            "empty_short_bio": q.filter(short_bio="").count(),
-            "empty_awards_achievements": q.filter(
-                awards_achievements=""
-            ).count(),
-            "empty_professional_development": q.filter(
-                professional_development=""
-            ).count(),
-            "empty_work_experience": q.filter(work_experience="").count(),
+            "users_count": Count("pk"),
+            "empty_any": Count(
+                "pk",
+                filter=Q(
+                    academic_degree__isnull=True,
+                    academic_title__isnull=True,
+                    awards_achievements="",
+                    professional_development="",
+                    work_experience="",
+                ),
+            ),
+            "empty_academic_degree": Count(
+                "pk", filter=Q(academic_degree__isnull=True)
+            ),
+            "empty_academic_title": Count(
+                "pk", filter=Q(academic_title__isnull=True)
+            ),
+            "empty_short_bio": Count("pk", filter=Q(short_bio="")),
+            "empty_awards_achievements": Count(
+                "pk", filter=Q(awards_achievements="")
+            ),
+            "empty_professional_development": Count(
+                "pk", filter=Q(professional_development="")
+            ),
+            "empty_work_experience": Count(
+                "pk", filter=Q(work_experience="")
+            ),
         }
 
+    @classmethod
+    def get_stats(cls):
+        return cls.objects.aggregate(**cls.stats_aggregates())
+
+    @classmethod
+    def bulk_upsert(cls, rows, batch_size: int = 1000) -> list:
+        """
+        Apply validated ``{"username", <HR_FIELDS>}`` rows, creating the
+        missing profiles and writing only the rows that differ. Return
+        the status of every row: ``created``, ``updated``, ``unchanged``,
+        ``unknown_user``, ``not_staff`` (only employees and teachers have
+        a profile) or ``unknown_department``.
+        """
+        users = {
+            username: (pk, is_staff)
+            for username, pk, is_staff in CustomUser.objects.lean()
+            .filter(username__in={row["username"] for row in rows})
+            .annotate(
+                is_staff_member=Ex(
+                    CustomUser.roles.through.objects.filter(
+                        customuser=OuterRef("pk"),
+                        role__in=(Role.EMPLOYEE, Role.TEACHER),
+                    )
+                )
+            )
+            .values_list("username", "pk", "is_staff_member")
+        }
+        departments = set(
+            Department.objects.filter(
+                pk__in={row.get("work_department") for row in rows} - {None}
+            ).values_list("pk", flat=True)
+        )
+        profiles = {
+            profile.user_id: profile
+            for profile in cls.objects.filter(
+                user_id__in=[pk for pk, is_staff in users.values() if is_staff]
+            ).only("user_id", *cls.HR_FIELDS)
+        }
+        attnames = {
+            name: cls._meta.get_field(name).attname for name in cls.HR_FIELDS
+        }
+
+        statuses = []
+        created = {}
+        updated = {}
+        updated_fields = set()
+        for row in rows:
+            if row["username"] not in users:
+                statuses.append("unknown_user")
+                continue
+            user_id, is_staff = users[row["username"]]
+            if not is_staff:
+                statuses.append("not_staff")
+                continue
+            department = row.get("work_department")
+            if department is not None and department not in departments:
+                statuses.append("unknown_department")
+                continue
+            profile = profiles.get(user_id)
+            if profile is None:
+                profile = profiles[user_id] = cls(user_id=user_id)
+                created[user_id] = profile
+
+            changed = False
+            for name, attname in attnames.items():
+                if name in row and getattr(profile, attname) != row[name]:
+                    setattr(profile, attname, row[name])
+                    updated_fields.add(name)
+                    changed = True
+            if user_id in created:
+                statuses.append("created")
+            elif changed:
+                updated[user_id] = profile
+                statuses.append("updated")
+            else:
+                statuses.append("unchanged")
+
+        if created or updated:
+            with transaction.atomic():
+                cls.objects.bulk_create(
+                    created.values(), batch_size=batch_size
+                )
+                cls.objects.bulk_update(
+                    updated.values(), updated_fields, batch_size=batch_size
+                )
+        return statuses
+
 
 class StudentProfile(models.Model):
     user = models.OneToOneField(CustomUser, models.CASCADE, unique=True)
     number_id = models.CharField(max_length=150)
     group = models.ForeignKey(
-        Group,
+        "brs.Group",
         models.CASCADE,
         verbose_name="Группа",
         null=True,
@@ -388,7 +668,7 @@ class StudentProfile(models.Model):
     allowed = models.BooleanField(default=True, null=True, blank=True)
     distance_education = models.BooleanField(default=False)
 
-    __group = None
+    __group_id = None
 
     class Meta:
         verbose_name = "Профиль студента"
@@ -396,13 +676,18 @@ class StudentProfile(models.Model):
 
     def __init__(self, *args, **kwargs) -> None:
         super().__init__(*args, **kwargs)
-        self.__group = self.group
+        # the id only, loading the group here costs a query per row
+        self.__group_id = self.__dict__.get("group_id")
 
     def __str__(self) -> str:
         return str(self.user)
 
+    def group_changed(self) -> bool:
+        """Whether the group differs from the one loaded or last saved."""
+        return self.group_id != self.__group_id
+
     def save_base(self, *args, **kwargs):
-        if self.group != self.__group and self.group is not None:
+        if self.group_changed() and self.group_id is not None:
             Discipline = apps.get_model("brs", "Discipline")
             GradeSum = apps.get_model("brs", "GradeSum")
             disciplines = Discipline.objects.filter(group=self.group)
@@ -437,7 +722,9 @@ class StudentProfile(models.Model):
                 ignore_conflicts=True,
             )
 
-        return super().save_base(*args, **kwargs)
+        result = super().save_base(*args, **kwargs)
+        self.__group_id = self.group_id
+        return result
 
 
 class BrsAdminProfile(models.Model):
@@ -468,35 +755,162 @@ class Requirement(models.Model):
     class Meta:
         verbose_name = "Зависимость"
         verbose_name_plural = "Зависимости"
+        indexes = [
+            models.Index(
+                fields=["admin", "confirmed"], name="requirement_admin_idx"
+            ),
+            models.Index(
+                fields=["effective_contract", "confirmed"],
+                name="requirement_contract_idx",
+            ),
+        ]
+
+    @staticmethod
+    def _pending_key(admin) -> str:
+        return f"requirements-pending:{getattr(admin, 'pk', admin)}"
+
+    @classmethod
+    def get_pending_count(cls, admin) -> int:
+        key = cls._pending_key(admin)
+        count = cache.get(key)
+        if count is None:
+            count = cls.objects.filter(admin=admin, confirmed=False).count()
+            cache.set(
+                key,
+                count,
+                getattr(settings, "REQUIREMENT_PENDING_CACHE_SECONDS", 300),
+            )
+        return count
+
+    @classmethod
+    def invalidate_pending_count(cls, admin):
+        cache.delete(cls._pending_key(admin))
+
+    @classmethod
+    def set_confirmed(cls, admin, effective_contracts, confirmed=True) -> int:
+        """
+        Confirm or unconfirm the requirements of ``admin`` for many
+        effective contracts with one UPDATE; rows already in the wanted
+        state are not touched. Return the number of updated rows.
+        """
+        updated = (
+            cls.objects.filter(
+                admin=admin, effective_contract__in=effective_contracts
+            )
+            .exclude(confirmed=confirmed)
+            .update(confirmed=confirmed)
+        )
+        if updated:
+            cls.invalidate_pending_count(admin)
+        return updated
+
+
+class InternalApiKey(models.Model):
+    """
+    A key of an internal service. Only the SHA-256 of the key is stored,
+    the key itself is shown once by ``issue``.
+    """
+
+    ALL_SCOPES = "*"
+
+    service = models.CharField("Сервис", max_length=100)
+    key_hash = models.CharField(max_length=64, unique=True, editable=False)
+    scopes = models.JSONField("Области доступа", default=list, blank=True)
+    is_active = models.BooleanField("Активен", default=True)
+    created = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        verbose_name = "Ключ внутреннего API"
+        verbose_name_plural = "Ключи внутреннего API"
+
+    def __str__(self) -> str:
+        return self.service
+
+    @staticmethod
+    def hash_key(key: str) -> str:
+        return hashlib.sha256(key.encode()).hexdigest()
+
+    @classmethod
+    def issue(cls, service: str, scopes=()):
+        key = secrets.token_urlsafe(32)
+        api_key = cls.objects.create(
+            service=service, key_hash=cls.hash_key(key), scopes=list(scopes)
+        )
+        return api_key, key
+
+
+class RevokedToken(models.Model):
+    """
+    A revoked token, ``jti:<id>``, or every token issued to a user up to
+    ``revoked_at``, ``user:<id>``; see ``revocation.RevocationList``.
+    """
+
+    key = models.CharField(max_length=64, unique=True)
+    revoked_at = models.DateTimeField()
+    expires = models.DateTimeField(db_index=True)
+
+    class Meta:
+        verbose_name = "Отозванный токен"
+        verbose_name_plural = "Отозванные токены"
+
+    def __str__(self) -> str:
+        return self.key
 
 
 @receiver(m2m_changed, sender=CustomUser.roles.through)
-def changing_role(sender, instance: CustomUser, action, **kwargs):
-    if action in ("post_add", "post_remove", "post_clear"):
-        instance = CustomUser.objects.filter(pk=instance.pk).first()
-        if not instance:
+def changing_role(sender, instance, action, reverse, pk_set, **kwargs):
+    if reverse:
+        # role.customuser_set changed: instance is the role
+        if action == "pre_clear":
+            instance._cleared_user_pks = set(
+                instance.customuser_set.values_list("pk", flat=True)
+            )
             return
-        if not (instance.is_employee or instance.is_teacher):
-            UserProfile.objects.filter(user=instance).delete()
-        if not instance.is_student:
-            StudentProfile.objects.filter(user=instance).delete()
-        if not (instance.is_brs_admin or instance.is_deccan):
-            BrsAdminProfile.objects.filter(user=instance).delete()
-        if instance.is_employee or instance.is_teacher:
-            try:
-                if not UserProfile.objects.filter(user=instance).exists():
-                    UserProfile.objects.create(user=instance)
-            except IntegrityError:
-                pass
-        if instance.is_student:
-            try:
-                if not StudentProfile.objects.filter(user=instance).exists():
-                    StudentProfile.objects.create(user=instance)
-            except IntegrityError:
-                pass
-        if instance.is_brs_admin or instance.is_deccan:
-            try:
-                if not BrsAdminProfile.objects.filter(user=instance).exists():
-                    BrsAdminProfile.objects.create(user=instance)
-            except IntegrityError:
-                pass
\ No newline at end of file
+        if action == "post_clear":
+            pk_set = instance.__dict__.pop("_cleared_user_pks", set())
+    else:
+        pk_set = {instance.pk}
+    if action not in ("post_add", "post_remove", "post_clear"):
+        return
+    if action != "post_add":
+        # tokens issued with the lost roles
+        user_pks = list(pk_set)
+        transaction.on_commit(
+            lambda: revocation.revocations.revoke_users(user_pks)
+        )
+    for user in CustomUser.objects.filter(pk__in=pk_set):
+        sync_role_profiles(user)
+
+
+def sync_role_profiles(instance: CustomUser):
+    """Create the profiles of the roles of the user, drop the others."""
+    if not (instance.is_employee or instance.is_teacher):
+        UserProfile.objects.filter(user=instance).delete()
+    if not instance.is_student:
+        StudentProfile.objects.filter(user=instance).delete()
+    if not (instance.is_brs_admin or instance.is_deccan):
+        BrsAdminProfile.objects.filter(user=instance).delete()
+    if instance.is_employee or instance.is_teacher:
+        try:
+            if not UserProfile.objects.filter(user=instance).exists():
+                UserProfile.objects.create(user=instance)
+        except IntegrityError:
+            pass
+    if instance.is_student:
+        try:
+            if not StudentProfile.objects.filter(user=instance).exists():
+                StudentProfile.objects.create(user=instance)
+        except IntegrityError:
+            pass
+    if instance.is_brs_admin or instance.is_deccan:
+        try:
+            if not BrsAdminProfile.objects.filter(user=instance).exists():
+                BrsAdminProfile.objects.create(user=instance)
+        except IntegrityError:
+            pass
+
+
+@receiver(post_save, sender=Requirement)
+@receiver(post_delete, sender=Requirement)
+def changing_requirement(sender, instance: Requirement, **kwargs):
+    Requirement.invalidate_pending_count(instance.admin_id)
\ No newline at end of file
@@ -1,6 +1,7 @@
 from rest_framework.permissions import SAFE_METHODS, BasePermission
 
 from authentication.models import CustomUser
+from authentication.permisson_classes import ApiClient
 
 
 class IsOwner(BasePermission):
@@ -48,4 +49,13 @@ class IsDeccan(BasePermission):
     def has_permission(self, request, view):
         if request.user.admin_dep == CustomUser.DUMR:
             return True
-        return request.user.is_deccan or request.user.is_staff
\ No newline at end of file
+        return request.user.is_deccan or request.user.is_staff
+
+
+class HasApiScope(BasePermission):
+    message = "The API key has no access to this endpoint"
+
+    def has_permission(self, request, view):
+        return isinstance(request.auth, ApiClient) and request.auth.has_scope(
+            getattr(view, "required_scope", None)
+        )
\ No newline at end of file
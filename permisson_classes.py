@@ -1,8 +1,18 @@
+import atexit
+import hmac
+import threading
+import time
+
 from django.conf import settings
 from django.contrib.auth.models import AnonymousUser
+from django.core.cache import cache
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
 from rest_framework import HTTP_HEADER_ENCODING, exceptions
 from rest_framework.authentication import BaseAuthentication
 
+from authentication.models import InternalApiKey
+
 
 def get_api_authorization_header(request) -> str:
     auth = request.META.get("HTTP_X_API_KEY", b"")
@@ -11,12 +21,147 @@ def get_api_authorization_header(request) -> str:
     return auth
 
 
+class ApiClient:
+    """The internal service behind an API key, set as ``request.auth``."""
+
+    def __init__(self, service: str, scopes=None):
+        self.service = service
+        self.scopes = None if scopes is None else frozenset(scopes)
+
+    def has_scope(self, scope) -> bool:
+        if scope is None or self.scopes is None:
+            return True
+        return scope in self.scopes or InternalApiKey.ALL_SCOPES in self.scopes
+
+
+class ApiKeyRegistry:
+    """
+    Active keys by hash, kept in process and reloaded every
+    ``refresh_seconds``, so authentication costs no query.
+    Looking up the SHA-256 of the presented key leaks nothing useful
+    about the stored keys through timing.
+    """
+
+    refresh_seconds = 60
+
+    def __init__(self):
+        self._clients = None
+        self._loaded = 0
+        self._lock = threading.Lock()
+
+    def clear(self):
+        self._clients = None
+
+    def load(self):
+        with self._lock:
+            self._clients = {
+                key_hash: ApiClient(service, scopes)
+                for key_hash, service, scopes in InternalApiKey.objects.filter(
+                    is_active=True
+                ).values_list("key_hash", "service", "scopes")
+            }
+            self._loaded = time.monotonic()
+
+    def get(self, key: str):
+        clients = self._clients
+        if (
+            clients is None
+            or time.monotonic() - self._loaded > self.refresh_seconds
+        ):
+            self.load()
+            clients = self._clients
+        return clients.get(InternalApiKey.hash_key(key))
+
+
+class ApiUsage:
+    """
+    Requests and total latency per service. Counted in process and
+    added to the shared cache every ``flush_seconds``, so the counters
+    of all workers end up in one place without a cache call per request.
+    A timer started by the first pending request flushes a worker that
+    goes idle, and the last counts are flushed at exit.
+    """
+
+    flush_seconds = 10
+
+    def __init__(self):
+        self._pending = {}
+        self._flushed = time.monotonic()
+        self._timer = None
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _key(service: str, counter: str) -> str:
+        return f"api-usage:{service}:{counter}"
+
+    def record(self, service: str, milliseconds: float):
+        with self._lock:
+            counters = self._pending.setdefault(service, [0, 0.0])
+            counters[0] += 1
+            counters[1] += milliseconds
+            if self._timer is None:
+                self._timer = threading.Timer(self.flush_seconds, self.flush)
+                self._timer.daemon = True
+                self._timer.start()
+        if time.monotonic() - self._flushed > self.flush_seconds:
+            self.flush()
+
+    def flush(self):
+        with self._lock:
+            pending, self._pending = self._pending, {}
+            self._flushed = time.monotonic()
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+        for service, (requests, milliseconds) in pending.items():
+            for counter, delta in (
+                ("requests", requests),
+                ("ms", round(milliseconds)),
+            ):
+                key = self._key(service, counter)
+                if cache.add(key, delta, None):
+                    continue
+                try:
+                    cache.incr(key, delta)
+                except ValueError:
+                    cache.set(key, delta, None)
+
+    def get(self, services) -> dict:
+        usage = {}
+        for service in services:
+            requests = cache.get(self._key(service, "requests"), 0)
+            milliseconds = cache.get(self._key(service, "ms"), 0)
+            usage[service] = {
+                "requests": requests,
+                "avg_ms": round(milliseconds / requests, 2) if requests else 0,
+            }
+        return usage
+
+
+registry = ApiKeyRegistry()
+usage = ApiUsage()
+atexit.register(usage.flush)
+
+
+@receiver(post_save, sender=InternalApiKey)
+@receiver(post_delete, sender=InternalApiKey)
+def changing_api_key(sender, **kwargs):
+    # other processes pick the change up on their next refresh
+    registry.clear()
+
+
 class InternalApiAccess(BaseAuthentication):
     def authenticate(self, request):
         api_key = get_api_authorization_header(request)
 
         if not api_key:
             raise exceptions.AuthenticationFailed("No API key")
-        elif api_key != settings.INTERNAL_API_KEY:
-            raise exceptions.AuthenticationFailed("Wrong API key")
-        return (AnonymousUser(), None)
\ No newline at end of file
+        client = registry.get(api_key)
+        if client is None:
+            legacy_key = getattr(settings, "INTERNAL_API_KEY", None)
+            if not legacy_key or not hmac.compare_digest(
+                api_key.encode(), legacy_key.encode()
+            ):
+                raise exceptions.AuthenticationFailed("Wrong API key")
+            client = ApiClient("default")
+        return (AnonymousUser(), client)
\ No newline at end of file
@@ -0,0 +1,110 @@
+import django
+from django.apps import apps
+from django.db import connections, transaction
+
+COUNTERS = (
+    "students",
+    "missing_grade_sums",
+    "stale_grade_sums",
+    "missing_journal_logs",
+    "stale_journal_logs",
+)
+
+
+def init_worker():
+    # with the spawn start method the worker starts without Django
+    django.setup()
+    connections.close_all()
+
+
+def reconcile_group(group_id, dry_run: bool = False) -> dict:
+    """
+    Bring GradeSum and JournalLog rows of the students of a group to
+    what ``StudentProfile.save_base`` creates on a group change: one
+    GradeSum per discipline and one JournalLog per journal of the group,
+    nothing for other groups' disciplines. Return the discrepancies.
+    """
+    StudentProfile = apps.get_model("authentication", "StudentProfile")
+    Discipline = apps.get_model("brs", "Discipline")
+    GradeSum = apps.get_model("brs", "GradeSum")
+    Journal = apps.get_model("brs", "Journal")
+    JournalLog = apps.get_model("brs", "JournalLog")
+
+    students = set(
+        StudentProfile.objects.filter(group_id=group_id).values_list(
+            "user_id", flat=True
+        )
+    )
+    result = dict.fromkeys(COUNTERS, 0)
+    result["group"] = group_id
+    result["students"] = len(students)
+    if not students:
+        return result
+
+    in_group = {"student__studentprofile__group_id": group_id}
+    stale_grade_sums = GradeSum.objects.filter(**in_group).exclude(
+        discipline__group_id=group_id
+    )
+    stale_journal_logs = JournalLog.objects.filter(**in_group).exclude(
+        discipline__group_id=group_id
+    )
+
+    disciplines = list(
+        Discipline.objects.filter(group_id=group_id).values_list(
+            "pk", flat=True
+        )
+    )
+    existing = set(
+        GradeSum.objects.filter(
+            **in_group, discipline_id__in=disciplines
+        ).values_list("student_id", "discipline_id")
+    )
+    missing_grade_sums = [
+        GradeSum(student_id=student, discipline_id=discipline)
+        for student in students
+        for discipline in disciplines
+        if (student, discipline) not in existing
+    ]
+
+    journals = list(
+        Journal.objects.filter(group_id=group_id).values_list(
+            "pk", "discipline_id", "date"
+        )
+    )
+    existing = set(
+        JournalLog.objects.filter(
+            **in_group, journal__group_id=group_id
+        ).values_list("student_id", "journal_id")
+    )
+    missing_journal_logs = [
+        JournalLog(
+            journal_id=journal,
+            discipline_id=discipline,
+            group_id=group_id,
+            student_id=student,
+            date=date,
+        )
+        for student in students
+        for journal, discipline, date in journals
+        if (student, journal) not in existing
+    ]
+
+    result["missing_grade_sums"] = len(missing_grade_sums)
+    result["missing_journal_logs"] = len(missing_journal_logs)
+    if dry_run:
+        result["stale_grade_sums"] = stale_grade_sums.count()
+        result["stale_journal_logs"] = stale_journal_logs.count()
+        return result
+
+    with transaction.atomic():
+        _, deleted = stale_grade_sums.delete()
+        result["stale_grade_sums"] = deleted.get(GradeSum._meta.label, 0)
+        _, deleted = stale_journal_logs.delete()
+        result["stale_journal_logs"] = deleted.get(JournalLog._meta.label, 0)
+        GradeSum.objects.bulk_create(
+            missing_grade_sums, batch_size=1000, ignore_conflicts=True
+        )
+        JournalLog.objects.bulk_create(
+            missing_journal_logs, batch_size=1000, ignore_conflicts=True
+        )
+    return result
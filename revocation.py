@@ -0,0 +1,223 @@
+import hashlib
+import math
+import threading
+import time
+import uuid
+from datetime import datetime, timedelta
+
+from django.apps import apps
+from django.conf import settings
+from django.core.cache import cache
+from django.utils import timezone
+from rest_framework_jwt.settings import api_settings
+
+VERSION_KEY = "revocation:version"
+FILTER_KEY = "revocation:filter"
+
+
+class BloomFilter:
+    """
+    Set membership in a bit array: no false negatives and about
+    ``error_rate`` false positives while it holds up to ``capacity``
+    items.
+    """
+
+    def __init__(self, capacity: int, error_rate: float, bits=None):
+        self.size = max(
+            64, int(-capacity * math.log(error_rate) / math.log(2) ** 2)
+        )
+        self.hashes = max(1, round(self.size / capacity * math.log(2)))
+        if bits is None:
+            self.bits = bytearray((self.size + 7) // 8)
+        elif len(bits) == (self.size + 7) // 8:
+            self.bits = bytearray(bits)
+        else:
+            raise ValueError("The bits do not match the filter size")
+
+    def _positions(self, item: str):
+        digest = hashlib.blake2b(item.encode(), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], "little")
+        h2 = int.from_bytes(digest[8:], "little") | 1
+        return [(h1 + i * h2) % self.size for i in range(self.hashes)]
+
+    def add(self, item: str):
+        for position in self._positions(item):
+            self.bits[position >> 3] |= 1 << (position & 7)
+
+    def __contains__(self, item: str) -> bool:
+        return all(
+            self.bits[position >> 3] & 1 << (position & 7)
+            for position in self._positions(item)
+        )
+
+
+def token_key(jti) -> str:
+    return f"jti:{jti}"
+
+
+def user_key(user_id) -> str:
+    return f"user:{user_id}"
+
+
+class RevocationList:
+    """
+    Revoked tokens, stored as RevokedToken rows. Tokens are checked
+    against an in-process Bloom filter of the revoked keys and the
+    database is queried only on a hit. The filter is shared through the
+    cache and reloaded when the version in the cache changes, which is
+    checked at most every ``sync_seconds``. A revocation rebuilds the
+    filter once and publishes it with the new version.
+    """
+
+    def __init__(self, sync_seconds: float = None):
+        self.sync_seconds = (
+            sync_seconds
+            if sync_seconds is not None
+            else getattr(settings, "TOKEN_REVOCATION_SYNC_SECONDS", 10)
+        )
+        self.filter = None
+        self.version = None
+        self.synced = 0.0
+        self._lock = threading.Lock()
+
+    def _new_filter(self, bits=None) -> BloomFilter:
+        return BloomFilter(
+            getattr(settings, "TOKEN_REVOCATION_CAPACITY", 100_000),
+            getattr(settings, "TOKEN_REVOCATION_ERROR_RATE", 0.01),
+            bits,
+        )
+
+    def _build(self) -> BloomFilter:
+        RevokedToken = apps.get_model("authentication", "RevokedToken")
+        bloom = self._new_filter()
+        for key in (
+            RevokedToken.objects.filter(expires__gt=timezone.now())
+            .values_list("key", flat=True)
+            .iterator(chunk_size=5000)
+        ):
+            bloom.add(key)
+        return bloom
+
+    def sync(self, force: bool = False):
+        now = time.monotonic()
+        if (
+            not force
+            and self.filter is not None
+            and now - self.synced < self.sync_seconds
+        ):
+            return
+        with self._lock:
+            version = cache.get(VERSION_KEY)
+            if version is None:
+                cache.add(VERSION_KEY, uuid.uuid4().hex, None)
+                version = cache.get(VERSION_KEY)
+            if version != self.version or self.filter is None:
+                bloom = None
+                stored = cache.get(FILTER_KEY)
+                if stored is not None and stored[0] == version:
+                    try:
+                        bloom = self._new_filter(stored[1])
+                    except ValueError:
+                        pass
+                if bloom is None:
+                    bloom = self._build()
+                    # tagged with the version read before the query, so a
+                    # filter missing a later revocation is never taken for
+                    # the current one
+                    cache.set(FILTER_KEY, (version, bytes(bloom.bits)), None)
+                self.filter = bloom
+                self.version = version
+            self.synced = now
+
+    def clear(self):
+        with self._lock:
+            self.filter = None
+            self.version = None
+
+    def revoke(self, keys, expires: datetime):
+        """Revoke ``keys`` until ``expires``."""
+        if not keys:
+            return
+        RevokedToken = apps.get_model("authentication", "RevokedToken")
+        now = timezone.now()
+        RevokedToken.objects.filter(expires__lte=now).delete()
+        RevokedToken.objects.bulk_create(
+            [
+                RevokedToken(key=key, revoked_at=now, expires=expires)
+                for key in keys
+            ],
+            update_conflicts=True,
+            unique_fields=["key"],
+            update_fields=["revoked_at", "expires"],
+        )
+        with self._lock:
+            for _ in range(3):
+                previous = cache.get(VERSION_KEY)
+                bloom = self._build()
+                # another process published while this one was querying,
+                # its filter may hold a revocation the query missed
+                if cache.get(VERSION_KEY) == previous:
+                    break
+            for key in keys:
+                bloom.add(key)
+            version = uuid.uuid4().hex
+            # published with its version, so the other processes load
+            # this filter on their next sync instead of each rebuilding
+            cache.set_many(
+                {
+                    VERSION_KEY: version,
+                    FILTER_KEY: (version, bytes(bloom.bits)),
+                },
+                None,
+            )
+            self.filter = bloom
+            self.version = version
+            self.synced = time.monotonic()
+
+    def revoke_token(self, payload: dict):
+        """Revoke the token with ``payload``, until it expires."""
+        expires_in = max(0, payload["exp"] - time.time())
+        self.revoke(
+            [token_key(payload["jti"])],
+            timezone.now() + timedelta(seconds=expires_in),
+        )
+
+    def revoke_user(self, user_id):
+        """Revoke every token issued to the user so far."""
+        self.revoke_users([user_id])
+
+    def revoke_users(self, user_ids):
+        lifetime = api_settings.JWT_EXPIRATION_DELTA + timedelta(
+            seconds=api_settings.JWT_LEEWAY
+        )
+        self.revoke(
+            [user_key(user_id) for user_id in user_ids],
+            timezone.now() + lifetime,
+        )
+
+    def is_revoked(self, payload: dict) -> bool:
+        self.sync()
+        keys = []
+        if payload.get("jti") and token_key(payload["jti"]) in self.filter:
+            keys.append(token_key(payload["jti"]))
+        if user_key(payload.get("user_id")) in self.filter:
+            keys.append(user_key(payload.get("user_id")))
+        if not keys:
+            return False
+
+        RevokedToken = apps.get_model("authentication", "RevokedToken")
+        revoked = dict(
+            RevokedToken.objects.filter(
+                key__in=keys, expires__gt=timezone.now()
+            ).values_list("key", "revoked_at")
+        )
+        if payload.get("jti") and token_key(payload["jti"]) in revoked:
+            return True
+        revoked_at = revoked.get(user_key(payload.get("user_id")))
+        if revoked_at is None:
+            return False
+        # iat is in whole seconds, tokens of the revoking second go too
+        return payload.get("iat", 0) <= revoked_at.timestamp()
+
+
+revocations = RevocationList()
@@ -0,0 +1,103 @@
+import random
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS, connections
+from rest_framework.permissions import SAFE_METHODS
+
+_replica = ContextVar("replica", default=None)
+
+
+def get_replicas() -> list:
+    return [
+        alias
+        for alias in getattr(settings, "AUTHENTICATION_REPLICAS", [])
+        if alias in settings.DATABASES
+    ]
+
+
+def _pin_key(user_pk) -> str:
+    return f"replica-pin:{user_pk}"
+
+
+def pin_to_primary(user):
+    """
+    Keep reads of ``user`` on the primary for a short window so they
+    see their own writes despite the replication lag.
+    """
+    if user is not None and user.is_authenticated:
+        cache.set(
+            _pin_key(user.pk),
+            True,
+            getattr(settings, "REPLICA_PIN_SECONDS", 5),
+        )
+
+
+def is_pinned(user) -> bool:
+    if user is None or not user.is_authenticated:
+        return False
+    return bool(cache.get(_pin_key(user.pk)))
+
+
+@contextmanager
+def use_replica():
+    """
+    Route the reads inside the block to a single replica picked at
+    random, so one request sees a consistent snapshot.
+    """
+    replicas = get_replicas()
+    token = _replica.set(random.choice(replicas) if replicas else None)
+    try:
+        yield
+    finally:
+        _replica.reset(token)
+
+
+class ReplicaRouter:
+    """
+    Sends reads to one of ``settings.AUTHENTICATION_REPLICAS`` only inside
+    ``use_replica()``, i.e. for views that opted in with
+    ``ReplicaReadMixin``. Everything else, including reads inside a
+    transaction, goes to the primary.
+
+        DATABASE_ROUTERS = ["authentication.routers.ReplicaRouter"]
+        AUTHENTICATION_REPLICAS = ["replica"]
+    """
+
+    def db_for_read(self, model, **hints):
+        replica = _replica.get()
+        if replica is None or connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            return DEFAULT_DB_ALIAS
+        return replica
+
+    def db_for_write(self, model, **hints):
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db not in get_replicas()
+
+
+class ReplicaReadMixin:
+    """
+    Serves safe-method requests from a replica unless the user wrote
+    something recently; unsafe requests pin the user to the primary.
+    """
+
+    def dispatch(self, request, *args, **kwargs):
+        user = getattr(request, "user", None)
+        if request.method not in SAFE_METHODS:
+            response = super().dispatch(request, *args, **kwargs)
+            pin_to_primary(getattr(self.request, "user", user))
+            return response
+        with use_replica():
+            return super().dispatch(request, *args, **kwargs)
+
+    def initial(self, request, *args, **kwargs):
+        super().initial(request, *args, **kwargs)
+        if _replica.get() is not None and is_pinned(request.user):
+            _replica.set(None)
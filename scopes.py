@@ -0,0 +1,147 @@
+import uuid
+
+from django.apps import apps
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from authentication.models import BrsAdminProfile, CustomUser, StudentProfile
+
+VERSION_KEY = "brs_scope:version"
+
+# kind: (model, lookup of its BRS institute id)
+DEFAULT_SOURCES = {
+    "groups": ("brs.Group", "institute"),
+    "departments": ("brs.Department", "institute"),
+}
+
+
+def get_sources() -> dict:
+    return getattr(settings, "BRS_SCOPE_SOURCES", DEFAULT_SOURCES)
+
+
+class BrsScope:
+    """
+    What a BRS admin or dean may see: the groups and departments of the
+    institute of their BrsAdminProfile and the students of those groups.
+    An unrestricted scope sees everything.
+    """
+
+    def __init__(
+        self,
+        institute=None,
+        groups=(),
+        departments=(),
+        students=(),
+        unrestricted=False,
+    ):
+        self.institute = institute
+        self.groups = frozenset(groups)
+        self.departments = frozenset(departments)
+        self.students = frozenset(students)
+        self.unrestricted = unrestricted
+
+    def filter(self, queryset, kind: str, field: str = "pk"):
+        """
+        Restrict ``queryset`` to the ids of ``kind``, one of groups,
+        departments or students, kept in its ``field``.
+        """
+        if self.unrestricted:
+            return queryset
+        return queryset.filter(**{f"{field}__in": getattr(self, kind)})
+
+
+def _key(user_id) -> str:
+    version = cache.get_or_set(VERSION_KEY, lambda: uuid.uuid4().hex, None)
+    return f"brs_scope:{version}:{user_id}"
+
+
+def build_scope(user_id) -> BrsScope:
+    institute = (
+        BrsAdminProfile.objects.filter(user_id=user_id)
+        .values_list("institute_id", flat=True)
+        .first()
+    )
+    if institute is None:
+        return BrsScope()
+    return scope_for_institute(institute)
+
+
+def scope_for_institute(institute) -> BrsScope:
+    ids = {}
+    for kind, (label, lookup) in get_sources().items():
+        ids[kind] = apps.get_model(label).objects.filter(
+            **{lookup: institute}
+        ).values_list("pk", flat=True)
+    ids["students"] = StudentProfile.objects.filter(
+        group__in=ids["groups"]
+    ).values_list("user_id", flat=True)
+    return BrsScope(institute, **ids)
+
+
+def get_scope(user: CustomUser) -> BrsScope:
+    """The cached scope of a BRS admin or dean."""
+    if user.admin_dep == CustomUser.DUMR or user.is_staff:
+        return BrsScope(unrestricted=True)
+    key = _key(user.pk)
+    scope = cache.get(key)
+    if scope is None:
+        scope = build_scope(user.pk)
+        cache.set(
+            key, scope, getattr(settings, "BRS_SCOPE_CACHE_SECONDS", 3600)
+        )
+    return scope
+
+
+def invalidate_user(user_id):
+    cache.delete(_key(user_id))
+
+
+def invalidate_all():
+    # the keys of every user change with the version
+    cache.set(VERSION_KEY, uuid.uuid4().hex, None)
+
+
+@receiver(post_save, sender=BrsAdminProfile)
+@receiver(post_delete, sender=BrsAdminProfile)
+def changing_brs_admin(sender, instance: BrsAdminProfile, **kwargs):
+    invalidate_user(instance.user_id)
+
+
+@receiver(post_save, sender=StudentProfile)
+@receiver(post_delete, sender=StudentProfile)
+def changing_student_group(
+    sender, instance: StudentProfile, signal, created=False, **kwargs
+):
+    update_fields = kwargs.get("update_fields")
+    if update_fields is not None and "group" not in update_fields:
+        return
+    if created or signal is post_delete:
+        # a student in no group is in no scope
+        changed = instance.group_id is not None
+    else:
+        # post_save runs before the profile takes the new group as saved
+        changed = instance.group_changed()
+    if changed:
+        invalidate_all()
+
+
+def changing_source(sender, **kwargs):
+    invalidate_all()
+
+
+def connect_sources():
+    """Invalidate the scopes when a group or department changes."""
+    for label, _ in get_sources().values():
+        try:
+            model = apps.get_model(label)
+        except LookupError:
+            # reported by build_scope when a scope is asked for
+            continue
+        for name, signal in (("save", post_save), ("delete", post_delete)):
+            signal.connect(
+                changing_source,
+                sender=model,
+                dispatch_uid=f"brs_scope_{name}_{label}",
+            )
@@ -1,3 +1,6 @@
+from operator import itemgetter
+from urllib.parse import urljoin
+
 from rest_framework import serializers
 from rest_framework.relations import PrimaryKeyRelatedField
 
@@ -6,6 +9,7 @@ from authentication.models import (
     Department,
     EducationDepartment,
     Institute,
+    Role,
     UserProfile,
 )
 
@@ -27,6 +31,23 @@ class EnumField(serializers.ChoiceField):
         self.fail("invalid")
 
 
+class AudienceSerializer(serializers.Serializer):
+    roles = serializers.ListField(
+        child=EnumField(choices=Role.ROLE_CHOICES), required=False
+    )
+    institute = serializers.IntegerField(required=False)
+    department = serializers.IntegerField(required=False)
+    group = serializers.IntegerField(required=False)
+    ec_status = serializers.ListField(
+        child=serializers.CharField(), required=False
+    )
+
+    def validate(self, attrs):
+        if not attrs:
+            raise serializers.ValidationError("Empty audience")
+        return attrs
+
+
 class UserSerializer(serializers.ModelSerializer):
     class Meta:
         model = CustomUser
@@ -62,6 +83,10 @@ class EducationDepartmentSerializer(serializers.ModelSerializer):
 
 class UserProfileSerializer(serializers.ModelSerializer):
     fullname = serializers.SerializerMethodField("get_fullname")
+    photo = serializers.ImageField(
+        use_url=False, required=False, allow_null=True
+    )
+    photo_variants = serializers.SerializerMethodField()
     institute = PrimaryKeyRelatedField(
         queryset=Institute.objects.all(), required=False
     )
@@ -89,11 +114,32 @@ class UserProfileSerializer(serializers.ModelSerializer):
             "professional_development",
             "work_experience",
             "photo",
+            "photo_variants",
         )
 
     def get_fullname(self, obj):
         return obj.user.fio()
 
+    def absolute_uri(self, url):
+        # the context is shared by all rows of a list
+        base = self.context.get("base_uri")
+        if base is None:
+            base = self.context["request"].build_absolute_uri("/")
+            self.context["base_uri"] = base
+        return urljoin(base, url).replace("http:", "https:")
+
+    def get_photo_variants(self, obj):
+        if not obj.photo_variants:
+            return {}
+        storage = obj.photo.storage
+        return {
+            width: {
+                ext: self.absolute_uri(storage.url(name))
+                for ext, name in formats.items()
+            }
+            for width, formats in obj.photo_variants.items()
+        }
+
     def to_representation(self, instance):
         data = super().to_representation(instance)
         data["work_department"] = DepartmentSerializer(
@@ -103,9 +149,205 @@ class UserProfileSerializer(serializers.ModelSerializer):
             instance.education_department
         ).data
 
-        request = self.context.get("request")
         if instance.photo:
-            data["photo"] = request.build_absolute_uri(
-                instance.photo.url
-            ).replace("http:", "https:")
-        return data
\ No newline at end of file
+            data["photo"] = self.absolute_uri(instance.photo.url)
+        return data
+
+
+class HrProfileSerializer(serializers.ModelSerializer):
+    """A row of the HR sync, the fields follow UserProfileSerializer."""
+
+    username = serializers.CharField(max_length=150)
+    # departments of a batch are checked by UserProfile.bulk_upsert at once
+    work_department = serializers.IntegerField(
+        min_value=1, required=False, allow_null=True
+    )
+
+    class Meta:
+        model = UserProfile
+        fields = ("username", *UserProfile.HR_FIELDS)
+
+
+class RequirementConfirmSerializer(serializers.Serializer):
+    effective_contracts = serializers.ListField(
+        child=serializers.IntegerField(), allow_empty=False, max_length=5000
+    )
+    confirmed = serializers.BooleanField(default=True)
+
+
+class ValuesSerializer:
+    """
+    Read-only twin of ``serializer_class`` for lists: the same
+    representation built from ``values_list`` rows, without model
+    instances or DRF fields. ``fields`` maps every output field to a
+    lookup, or to a tuple of lookups passed to ``map_<field>``. Fields
+    declared as EnumField in ``serializer_class`` map by their choices.
+    """
+
+    serializer_class = None
+    fields = {}
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        # the columns of every field, computed once per class
+        lookups = []
+        cls._layout = []
+        for name, lookup in cls.fields.items():
+            columns = []
+            for column in (lookup,) if isinstance(lookup, str) else lookup:
+                if column not in lookups:
+                    lookups.append(column)
+                columns.append(lookups.index(column))
+            cls._layout.append((name, columns))
+        cls._lookups = tuple(lookups)
+
+    def __init__(self, rows, context=None):
+        self.rows = rows
+        self.context = {} if context is None else context
+
+    @classmethod
+    def values(cls, queryset):
+        return queryset.values_list(*cls._lookups)
+
+    def prepare(self, rows):
+        """Load what the rows refer to, once for all of them."""
+
+    def _mappers(self):
+        declared = self.serializer_class._declared_fields
+        mappers = []
+        for name, columns in self._layout:
+            method = getattr(self, f"map_{name}", None)
+            if method is None and isinstance(declared.get(name), EnumField):
+                method = declared[name].choices.get
+            if len(columns) > 1:
+                getter = itemgetter(*columns)
+                mappers.append(
+                    (name, lambda row, g=getter, m=method: m(*g(row)))
+                )
+            elif method is not None:
+                mappers.append(
+                    (name, lambda row, c=columns[0], m=method: m(row[c]))
+                )
+            else:
+                mappers.append((name, itemgetter(columns[0])))
+        return mappers
+
+    @property
+    def data(self) -> list:
+        rows = list(self.rows)
+        self.prepare(rows)
+        mappers = self._mappers()
+        return [
+            {name: mapper(row) for name, mapper in mappers} for row in rows
+        ]
+
+
+class InstituteValuesSerializer(ValuesSerializer):
+    serializer_class = InstituteSerializer
+    fields = {"id": "id", "name": "name", "unit": "unit"}
+
+
+class UserValuesSerializer(ValuesSerializer):
+    serializer_class = UserSerializer
+    fields = {
+        "id": "id",
+        "username": "username",
+        "first_name": "first_name",
+        "middle_name": "middle_name",
+        "last_name": "last_name",
+        "roles": "id",
+    }
+
+    def prepare(self, rows):
+        self.roles = {}
+        for user_id, role_id in (
+            CustomUser.roles.through.objects.filter(
+                customuser_id__in=[row[0] for row in rows]
+            )
+            .order_by("role_id")
+            .values_list("customuser_id", "role_id")
+        ):
+            self.roles.setdefault(user_id, []).append(role_id)
+
+    def map_roles(self, user_id):
+        return self.roles.get(user_id, [])
+
+
+class UserProfileValuesSerializer(ValuesSerializer):
+    serializer_class = UserProfileSerializer
+    fields = {
+        "id": "id",
+        "user": "user_id",
+        "fullname": (
+            "user__middle_name",
+            "user__first_name",
+            "user__last_name",
+        ),
+        "institute": "institute_id",
+        "work_department": (
+            "work_department_id",
+            "work_department__name",
+            "work_department__institute_id",
+            "work_department__division_id",
+            "work_department__allow_application",
+        ),
+        "education_department": (
+            "education_department_id",
+            "education_department__name",
+            "education_department__institute_id",
+        ),
+        "position": "position",
+        "academic_degree": "academic_degree",
+        "academic_title": "academic_title",
+        "short_bio": "short_bio",
+        "awards_achievements": "awards_achievements",
+        "professional_development": "professional_development",
+        "work_experience": "work_experience",
+        "photo": "photo",
+        "photo_variants": "photo_variants",
+    }
+
+    absolute_uri = UserProfileSerializer.absolute_uri
+
+    def prepare(self, rows):
+        self.storage = UserProfile._meta.get_field("photo").storage
+        # what the nested serializers give for a missing object
+        self.no_department = dict(DepartmentSerializer().data)
+        self.no_education_department = dict(
+            EducationDepartmentSerializer().data
+        )
+
+    def map_fullname(self, *names):
+        return " ".join(names)
+
+    def map_work_department(self, pk, *values):
+        if pk is None:
+            return self.no_department
+        name, institute, division, allow_application = values
+        return {
+            "id": pk,
+            "name": name,
+            "institute": institute,
+            "division": division,
+            "allow_application": allow_application,
+        }
+
+    def map_education_department(self, pk, name, institute):
+        if pk is None:
+            return self.no_education_department
+        return {"id": pk, "name": name, "institute": institute}
+
+    def map_photo(self, name):
+        if not name:
+            return None
+        return self.absolute_uri(self.storage.url(name))
+
+    def map_photo_variants(self, variants):
+        if not variants:
+            return {}
+        return {
+            width: {
+                ext: self.map_photo(name) for ext, name in formats.items()
+            }
+            for width, formats in variants.items()
+        }
@@ -0,0 +1,209 @@
+import fcntl
+import os
+import shutil
+import sqlite3
+import tempfile
+from datetime import datetime, timezone
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+
+from authentication.models import (
+    CustomUser,
+    Department,
+    Division,
+    EducationDepartment,
+    Institute,
+    StudentProfile,
+    UserProfile,
+)
+
+SCHEMA_VERSION = 1
+
+# table: (model, columns), the first column is the primary key
+TABLES = {
+    "institutes": (Institute, ("id", "name", "unit")),
+    "divisions": (Division, ("id", "name")),
+    "departments": (
+        Department,
+        ("id", "name", "institute_id", "division_id", "allow_application"),
+    ),
+    "education_departments": (
+        EducationDepartment,
+        ("id", "name", "institute_id"),
+    ),
+    "users": (
+        CustomUser,
+        (
+            "id",
+            "username",
+            "middle_name",
+            "first_name",
+            "last_name",
+            "is_active",
+            "admin_dep",
+            "telegram_id",
+        ),
+    ),
+    "profiles": (
+        UserProfile,
+        (
+            "user_id",
+            "institute_id",
+            "division_id",
+            "work_department_id",
+            "education_department_id",
+            "position",
+            "academic_degree",
+            "academic_title",
+        ),
+    ),
+    "student_profiles": (
+        StudentProfile,
+        ("user_id", "group_id", "number_id", "distance_education"),
+    ),
+}
+
+
+def get_snapshot_path() -> str:
+    # no default, the file lists every user and must not end up in a
+    # publicly served directory such as MEDIA_ROOT
+    path = getattr(settings, "DIRECTORY_SNAPSHOT_PATH", None)
+    if not path:
+        raise ImproperlyConfigured(
+            "DIRECTORY_SNAPSHOT_PATH must be set to a private location"
+        )
+    return path
+
+
+def _queryset(model):
+    if model is CustomUser:
+        return CustomUser.objects.lean()
+    return model.objects.all()
+
+
+def _rows(table):
+    model, columns = TABLES[table]
+    queryset = _queryset(model).order_by().values_list(*columns)
+    if table != "users":
+        yield from queryset.iterator(chunk_size=5000)
+        return
+    masks = {}
+    for user_id, role_id in CustomUser.roles.through.objects.values_list(
+        "customuser_id", "role_id"
+    ).iterator(chunk_size=5000):
+        # the bits of autocomplete.role_mask
+        masks[user_id] = masks.get(user_id, 0) | 1 << role_id
+    for row in queryset.iterator(chunk_size=5000):
+        yield (*row, masks.get(row[0], 0))
+
+
+def _columns(table):
+    columns = TABLES[table][1]
+    return columns + ("roles",) if table == "users" else columns
+
+
+def _create_schema(db):
+    for table in TABLES:
+        columns = _columns(table)
+        db.execute(
+            f"CREATE TABLE {table} ({columns[0]} INTEGER PRIMARY KEY, "
+            + ", ".join(columns[1:])
+            + ")"
+        )
+    db.execute("CREATE TABLE meta (key TEXT PRIMARY KEY, value)")
+    db.execute("CREATE INDEX profiles_institute ON profiles (institute_id)")
+    db.execute(
+        "CREATE INDEX profiles_department ON profiles (work_department_id)"
+    )
+    db.execute("CREATE INDEX students_group ON student_profiles (group_id)")
+
+
+def _sync_table(db, table) -> int:
+    columns = _columns(table)
+    key = columns[0]
+    current = {row[0]: row for row in db.execute(f"SELECT * FROM {table}")}
+    changed = []
+    for row in _rows(table):
+        # sqlite keeps booleans as integers
+        row = tuple(int(v) if isinstance(v, bool) else v for v in row)
+        if current.pop(row[0], None) != row:
+            changed.append(row)
+    placeholders = ", ".join("?" * len(columns))
+    db.executemany(
+        f"INSERT OR REPLACE INTO {table} VALUES ({placeholders})", changed
+    )
+    db.executemany(
+        f"DELETE FROM {table} WHERE {key} = ?", ((pk,) for pk in current)
+    )
+    return len(changed) + len(current)
+
+
+def read_meta(path: str) -> dict:
+    if not os.path.exists(path):
+        return {}
+    db = sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+    try:
+        return dict(db.execute("SELECT key, value FROM meta"))
+    except sqlite3.DatabaseError:
+        return {}
+    finally:
+        db.close()
+
+
+def write_snapshot(path: str = None, full: bool = False) -> dict:
+    """
+    Write the directory into a single SQLite file at ``path``.
+
+    The previous snapshot is copied and only the rows that changed are
+    rewritten; a new file is made when there is none, its schema is
+    older or ``full`` is set. The file is replaced atomically, so
+    readers never see a half-written snapshot, and writers of every
+    process take turns on ``<path>.lock``, so no two of them make the
+    same generation.
+    """
+    path = path or get_snapshot_path()
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    with open(f"{path}.lock", "a") as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        try:
+            return _write_snapshot(path, full)
+        finally:
+            fcntl.flock(lock, fcntl.LOCK_UN)
+
+
+def _write_snapshot(path: str, full: bool) -> dict:
+    meta = read_meta(path)
+    incremental = not full and meta.get("schema_version") == SCHEMA_VERSION
+    fd, tmp_path = tempfile.mkstemp(
+        dir=os.path.dirname(path) or ".", suffix=".tmp"
+    )
+    os.close(fd)
+    try:
+        if incremental:
+            shutil.copyfile(path, tmp_path)
+        else:
+            os.remove(tmp_path)
+        db = sqlite3.connect(tmp_path)
+        try:
+            if not incremental:
+                _create_schema(db)
+            changes = {table: _sync_table(db, table) for table in TABLES}
+            meta = {
+                "schema_version": SCHEMA_VERSION,
+                "generation": int(meta.get("generation", 0)) + 1,
+                "generated_at": datetime.now(timezone.utc).isoformat(),
+                "changed_rows": sum(changes.values()),
+            }
+            db.executemany(
+                "INSERT OR REPLACE INTO meta VALUES (?, ?)", meta.items()
+            )
+            db.commit()
+        finally:
+            db.close()
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    return {**meta, "incremental": incremental, "changes": changes}
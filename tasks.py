@@ -0,0 +1,93 @@
+import posixpath
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+
+from django.apps import apps
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.db import close_old_connections
+from django.utils.module_loading import import_string
+
+PHOTO_WIDTHS = (96, 320, 800)
+PHOTO_FORMATS = (("webp", "WEBP"), ("jpeg", "JPEG"))
+PHOTO_QUALITY = 82
+
+_executor = None
+
+
+def _run_local(func, *args):
+    close_old_connections()
+    try:
+        func(*args)
+    finally:
+        close_old_connections()
+
+
+def enqueue(func, *args):
+    """
+    Run ``func(*args)`` off the request path.
+
+    ``settings.AUTHENTICATION_TASK_BACKEND`` is a dotted path to a
+    callable ``backend(func, *args)`` handing the call to a real queue;
+    without it the call runs in a local background thread, and with
+    ``AUTHENTICATION_TASKS_EAGER`` it runs immediately.
+    """
+    global _executor
+    backend = getattr(settings, "AUTHENTICATION_TASK_BACKEND", None)
+    if backend:
+        import_string(backend)(func, *args)
+    elif getattr(settings, "AUTHENTICATION_TASKS_EAGER", False):
+        func(*args)
+    else:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=1, thread_name_prefix="authentication-tasks"
+            )
+        _executor.submit(_run_local, func, *args)
+
+
+def process_photo(profile_pk):
+    """
+    Store normalized copies of the profile photo at ``PHOTO_WIDTHS``
+    in every format of ``PHOTO_FORMATS`` and save their names to
+    ``UserProfile.photo_variants``.
+    """
+    from PIL import Image, ImageOps
+
+    UserProfile = apps.get_model("authentication", "UserProfile")
+    profile = UserProfile.objects.filter(pk=profile_pk).only("photo").first()
+    if profile is None or not profile.photo:
+        return
+    name = profile.photo.name
+    storage = profile.photo.storage
+
+    with profile.photo.open("rb") as f:
+        image = Image.open(f)
+        image = ImageOps.exif_transpose(image).convert("RGB")
+
+    stem = posixpath.splitext(name)[0]
+    variants = {}
+    for width in PHOTO_WIDTHS:
+        resized = image.copy()
+        resized.thumbnail((width, width * 4), Image.Resampling.LANCZOS)
+        for ext, image_format in PHOTO_FORMATS:
+            buffer = BytesIO()
+            resized.save(buffer, image_format, quality=PHOTO_QUALITY)
+            variants.setdefault(str(width), {})[ext] = storage.save(
+                f"{stem}_{width}.{ext}", ContentFile(buffer.getvalue())
+            )
+
+    # the photo could be replaced while it was processed
+    updated = UserProfile.objects.filter(pk=profile_pk, photo=name).update(
+        photo_variants=variants
+    )
+    if not updated:
+        delete_photo_variants(variants)
+
+
+def delete_photo_variants(variants):
+    UserProfile = apps.get_model("authentication", "UserProfile")
+    storage = UserProfile._meta.get_field("photo").storage
+    for formats in variants.values():
+        for name in formats.values():
+            storage.delete(name)
@@ -1,8 +1,88 @@
+import datetime
+import fcntl
+import json
+import os
+import shutil
+import sqlite3
+import tempfile
+import threading
+import time
+import unittest
+from io import BytesIO, StringIO
+from pathlib import Path
+from unittest import mock
+
+import jwt
+from asgiref.sync import sync_to_async
+from django.apps import apps
+from django.conf import settings
+from django.contrib.admin.sites import AdminSite
+from django.core.cache import cache
+from django.core.exceptions import ImproperlyConfigured
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import connection, transaction
+from django.test import (
+    AsyncRequestFactory,
+    SimpleTestCase,
+    TestCase,
+    override_settings,
+    tag,
+)
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
+from PIL import Image
 from rest_framework import status
-from rest_framework.test import APITestCase
+from rest_framework.renderers import JSONRenderer
+from rest_framework.response import Response
+from rest_framework.test import (
+    APIRequestFactory,
+    APITestCase,
+    force_authenticate,
+)
+from rest_framework.views import APIView
+from rest_framework_jwt.settings import api_settings
 
-from authentication.models import CustomUser, Department, Role
+from authentication import (
+    async_views,
+    autocomplete,
+    benchmarks,
+    custom_jwt_payload,
+    datagen,
+    reconcile,
+    revocation,
+    routers,
+    scopes,
+    snapshot,
+)
+from authentication.admin import CustomUserAdmin, EstimatedCountPaginator
+from authentication.models import (
+    BrsAdminProfile,
+    CustomUser,
+    Department,
+    Institute,
+    InternalApiKey,
+    Requirement,
+    Role,
+    StudentProfile,
+    UserProfile,
+)
+from authentication.permisson_classes import ApiUsage, registry, usage
+from authentication.serializers import (
+    InstituteSerializer,
+    InstituteValuesSerializer,
+    UserProfileSerializer,
+    UserProfileValuesSerializer,
+    UserSerializer,
+    UserValuesSerializer,
+)
+from authentication.tasks import PHOTO_WIDTHS
+from authentication.throttling import SlidingWindowLimiter
+from brs.models import Department as BrsDepartment
+from brs.models import Discipline, GradeSum, Group
+from brs.models import Institute as BrsInstitute
+from brs.models import Journal, JournalLog
+from effective_contract.models import EffectiveContract
 
 
 class UserTest(APITestCase):
@@ -50,28 +130,1598 @@ class UserTest(APITestCase):
 
     def test_create_user_with_department(self):
         department = Department.objects.create(name="Computer Science")
-        user = CustomUser.objects.create(
-            username="Tony", department=department
+        user = CustomUser.objects.create(username="Tony")
+        user.roles.add(Role.objects.create(id=Role.EMPLOYEE))
+        UserProfile.objects.filter(user=user).update(
+            work_department=department
         )
 
-        self.assertEqual(user.userprofile.department.name, department.name)
+        user = CustomUser.objects.get(pk=user.pk)
+        self.assertEqual(
+            user.userprofile.work_department.name, department.name
+        )
 
     def test_user_can_obtain_token(self):
-        token_obtain_url = reverse("token_obtain_pair")
+        token_obtain_url = reverse("obtain_jwt_token")
         data = {"username": "testuser", "password": "testpassword"}
         response = self.client.post(token_obtain_url, data, format="json")
         self.assertEqual(response.status_code, status.HTTP_200_OK)
-        self.assertIn("access", response.data)
-        self.assertIn("refresh", response.data)
+        self.assertIn("token", response.data)
+        self.assertEqual(response.data["user_id"], self.test_user.pk)
 
     def test_user_can_refresh_token(self):
-        token_obtain_url = reverse("token_obtain_pair")
-        token_refresh_url = reverse("token_refresh")
+        token_obtain_url = reverse("obtain_jwt_token")
+        token_refresh_url = reverse("obtain_jwt_token_refresh")
         data = {"username": "testuser", "password": "testpassword"}
         token_obtain = self.client.post(token_obtain_url, data, format="json")
-        refresh_token = {"refresh": token_obtain.data["refresh"]}
+        refresh_token = {"token": token_obtain.data["token"]}
         response = self.client.post(
             token_refresh_url, refresh_token, format="json"
         )
         self.assertEqual(response.status_code, status.HTTP_200_OK)
-        self.assertIn("access", response.data)
\ No newline at end of file
+        self.assertIn("token", response.data)
+
+
+@tag("benchmark")
+class BenchmarkTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        datagen.generate_university(
+            users=300,
+            students=100,
+            teachers=50,
+            institutes=2,
+            departments=2,
+            groups=4,
+            admins=5,
+            batch_size=100,
+        )
+
+    def test_generated_data(self):
+        self.assertEqual(
+            CustomUser.objects.filter(
+                username__startswith=datagen.USERNAME_PREFIX
+            ).count(),
+            300,
+        )
+        self.assertEqual(StudentProfile.objects.count(), 100)
+        self.assertEqual(UserProfile.objects.count(), 200)
+        self.assertEqual(
+            CustomUser.objects.get(
+                username=datagen.username(100)
+            ).effectivecontract_set.count(),
+            20,
+        )
+        self.assertEqual(
+            BrsAdminProfile.objects.count(),
+            CustomUser.objects.filter(
+                roles__in=[Role.BRS_ADMIN, Role.DECCAN]
+            ).count(),
+        )
+
+    def test_suite_has_no_regressions(self):
+        results = benchmarks.run_suite(repeat=3, warmup=1)
+
+        self.assertEqual(set(results), set(benchmarks.SCENARIOS))
+        self.assertTrue(
+            benchmarks.BASELINE_PATH.exists(),
+            "no baseline, store one with --update-baseline",
+        )
+        baseline = benchmarks.load_baseline(machine_path=None)
+        self.assertEqual(set(baseline), set(benchmarks.SCENARIOS))
+        # latency and memory of the tiny test data mean nothing, they
+        # are compared by the command against the machine baseline
+        self.assertEqual(
+            benchmarks.compare(results, baseline, metrics=("queries",)), []
+        )
+
+    def test_runs_as_dedicated_staff_user(self):
+        ctx = benchmarks.Context("password")
+
+        self.assertEqual(ctx.employee.username, benchmarks.BENCH_USERNAME)
+        self.assertTrue(ctx.employee.is_staff)
+        self.assertTrue(ctx.employee.is_employee)
+        self.assertFalse(
+            CustomUser.objects.filter(
+                username__startswith=datagen.USERNAME_PREFIX, is_staff=True
+            ).exists()
+        )
+
+    def test_compare_reports_regressions(self):
+        baseline = {
+            "users_list": {"queries": 1, "p95": 10.0, "memory_kib": 1.0}
+        }
+        results = {
+            "users_list": {"queries": 2, "p95": 13.0, "memory_kib": 1.0}
+        }
+
+        self.assertEqual(len(benchmarks.compare(results, baseline)), 2)
+        self.assertEqual(
+            benchmarks.compare(results, baseline, tolerance=0.5)[1:], []
+        )
+
+    def test_compare_requires_machine_baseline(self):
+        results = {
+            "users_list": {"queries": 1, "p95": 1.0, "memory_kib": 1.0}
+        }
+
+        self.assertEqual(
+            benchmarks.compare(results, {"users_list": {"queries": 1}}),
+            [
+                "users_list: no p95 baseline",
+                "users_list: no memory_kib baseline",
+            ],
+        )
+
+    def test_baseline_keeps_machine_metrics_apart(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        path = Path(directory, "baseline.json")
+        machine_path = Path(directory, "baseline.local.json")
+        results = {
+            "users_list": {
+                "queries": 1,
+                "p50": 1.0,
+                "p95": 2.0,
+                "memory_kib": 3.0,
+            }
+        }
+
+        benchmarks.save_baseline(results, path, machine_path)
+
+        self.assertEqual(
+            json.loads(path.read_text()), {"users_list": {"queries": 1}}
+        )
+        self.assertEqual(
+            benchmarks.load_baseline(path, machine_path),
+            {"users_list": {"queries": 1, "p95": 2.0, "memory_kib": 3.0}},
+        )
+
+    def test_serialization_cpu(self):
+        results = benchmarks.serialization_cpu(repeat=1)
+
+        self.assertEqual(results["users"]["rows"], 300)
+        self.assertEqual(results["profiles"]["rows"], 200)
+
+    def test_hr_sync(self):
+        result = benchmarks.hr_sync(rows=100)
+
+        self.assertEqual(result["rows"], 100)
+        self.assertEqual(result["statuses"], {"updated": 50, "unchanged": 50})
+
+
+@override_settings(
+    AUTHENTICATION_BACKENDS=["authentication.backends.RoleAwareModelBackend"],
+    PASSWORD_HASHERS=[
+        "authentication.hashers.ConfigurablePBKDF2PasswordHasher"
+    ],
+    PASSWORD_HASHER_ITERATIONS=1,
+)
+class TokenIssueTest(APITestCase):
+    def setUp(self):
+        self.user = CustomUser.objects.create_user(
+            "tokenuser",
+            password="pw",
+            first_name="Иван",
+            middle_name="Иванов",
+            last_name="Иванович",
+        )
+        self.user.roles.add(
+            Role.objects.create(id=Role.TEACHER),
+            Role.objects.create(id=Role.EMPLOYEE),
+        )
+
+    def test_get_with_roles(self):
+        with self.assertNumQueries(1):
+            user = CustomUser.get_with_roles("tokenuser")
+            roles = user.get_roles_str()
+
+        self.assertEqual(roles, ["employee", "teacher"])
+        self.assertTrue(user.is_teacher)
+        self.assertFalse(user.is_student)
+        self.assertIsNone(CustomUser.get_with_roles("missing"))
+
+    def test_token_payload(self):
+        url = reverse("obtain_jwt_token")
+        data = {"username": "tokenuser", "password": "pw"}
+        response = self.client.post(url, data, format="json")
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data["role"], ["employee", "teacher"])
+        self.assertEqual(response.data["full_name"], "Иванов Иван Иванович")
+
+    def test_wrong_password(self):
+        url = reverse("obtain_jwt_token")
+        data = {"username": "tokenuser", "password": "wrong"}
+        response = self.client.post(url, data, format="json")
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+@override_settings(AUTHENTICATION_REPLICAS=["default"])
+class ReplicaRouterTest(SimpleTestCase):
+    def setUp(self):
+        self.router = routers.ReplicaRouter()
+
+    def test_reads_go_to_primary_by_default(self):
+        self.assertEqual(self.router.db_for_read(CustomUser), "default")
+
+    def test_writes_always_go_to_primary(self):
+        with routers.use_replica():
+            self.assertEqual(self.router.db_for_write(CustomUser), "default")
+
+    @override_settings(AUTHENTICATION_REPLICAS=["replica"])
+    def test_unknown_replica_is_ignored(self):
+        if "replica" in settings.DATABASES:
+            self.skipTest("replica alias is configured")
+        with routers.use_replica():
+            self.assertEqual(self.router.db_for_read(CustomUser), "default")
+
+
+class RoutedReadView(routers.ReplicaReadMixin, APIView):
+    authentication_classes = []
+    permission_classes = []
+    throttle_classes = []
+
+    def get(self, request):
+        return Response(routers.ReplicaRouter().db_for_read(CustomUser))
+
+
+@mock.patch.object(routers, "get_replicas", return_value=["replica"])
+class ReplicaRoutingTest(SimpleTestCase):
+    """
+    The router with a replica configured, outside of any transaction
+    so that reads are actually routed.
+    """
+
+    def setUp(self):
+        cache.clear()
+        self.view = RoutedReadView.as_view()
+        self.user = CustomUser(pk=1, username="reader")
+
+    def get(self):
+        request = APIRequestFactory().get("/")
+        force_authenticate(request, user=self.user)
+        return self.view(request).data
+
+    def test_safe_read_goes_to_replica(self, get_replicas):
+        router = routers.ReplicaRouter()
+        with routers.use_replica():
+            self.assertEqual(router.db_for_read(CustomUser), "replica")
+        self.assertEqual(router.db_for_read(CustomUser), "default")
+
+    def test_view_reads_from_replica(self, get_replicas):
+        self.assertEqual(self.get(), "replica")
+
+    def test_pinned_user_reads_from_primary(self, get_replicas):
+        routers.pin_to_primary(self.user)
+
+        self.assertEqual(self.get(), "default")
+
+
+@override_settings(AUTHENTICATION_REPLICAS=["replica"])
+class ReplicaReadTest(APITestCase):
+    databases = {"default", "replica"}
+
+    @classmethod
+    def setUpClass(cls):
+        if "replica" not in settings.DATABASES:
+            raise unittest.SkipTest("replica database alias is not set")
+        super().setUpClass()
+
+    def setUp(self):
+        cache.clear()
+        self.user = CustomUser.objects.create_user("reader", password="pw")
+
+    def test_reads_inside_transaction_stay_on_primary(self):
+        router = routers.ReplicaRouter()
+        with routers.use_replica():
+            alias = router.db_for_read(CustomUser)
+        self.assertEqual(alias, "default")
+
+    def test_write_pins_user_to_primary(self):
+        self.assertFalse(routers.is_pinned(self.user))
+        routers.pin_to_primary(self.user)
+        self.assertTrue(routers.is_pinned(self.user))
+
+
+class AsyncViewsTest(TestCase):
+    def setUp(self):
+        self.factory = AsyncRequestFactory()
+        self.user = CustomUser.objects.create_user("async", password="pw")
+        self.user.roles.add(Role.objects.create(id=Role.TEACHER))
+        self.header = benchmarks.jwt_header(self.user)
+
+    async def test_get_roles(self):
+        request = self.factory.get("/", HTTP_AUTHORIZATION=self.header)
+        response = await async_views.get_roles(request)
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(json.loads(response.content), ["teacher"])
+
+    async def test_get_roles_requires_authentication(self):
+        response = await async_views.get_roles(self.factory.get("/"))
+
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    async def test_only_get_is_allowed(self):
+        request = self.factory.post("/", HTTP_AUTHORIZATION=self.header)
+        response = await async_views.get_roles(request)
+
+        self.assertEqual(
+            response.status_code, status.HTTP_405_METHOD_NOT_ALLOWED
+        )
+
+    async def test_through_the_handler(self):
+        url = reverse("async_roles")
+        response = await self.async_client.get(
+            url, HTTP_AUTHORIZATION=self.header
+        )
+        not_allowed = await self.async_client.post(
+            url, HTTP_AUTHORIZATION=self.header
+        )
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.json(), ["teacher"])
+        self.assertEqual(
+            not_allowed.status_code, status.HTTP_405_METHOD_NOT_ALLOWED
+        )
+
+    async def test_expired_token(self):
+        payload = api_settings.JWT_PAYLOAD_HANDLER(self.user)
+        payload["exp"] = datetime.datetime.utcnow() - datetime.timedelta(
+            minutes=1
+        )
+        token = api_settings.JWT_ENCODE_HANDLER(payload)
+        header = f"{api_settings.JWT_AUTH_HEADER_PREFIX} {token}"
+        request = self.factory.get("/", HTTP_AUTHORIZATION=header)
+        response = await async_views.get_roles(request)
+
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    async def test_revoked_token(self):
+        self.addCleanup(revocation.revocations.clear)
+        self.addCleanup(cache.clear)
+        await sync_to_async(revocation.revocations.revoke_user)(self.user.pk)
+        request = self.factory.get("/", HTTP_AUTHORIZATION=self.header)
+        response = await async_views.get_roles(request)
+
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    async def test_institute_list(self):
+        await Institute.objects.acreate(name="ИМИТ")
+        response = await async_views.institute_list(self.factory.get("/"))
+
+        self.assertEqual(
+            [i["name"] for i in json.loads(response.content)], ["ИМИТ"]
+        )
+
+    async def test_user_profile_stats_matches_sync(self):
+        self.user.is_staff = True
+        await self.user.asave(update_fields=["is_staff"])
+        request = self.factory.get("/", HTTP_AUTHORIZATION=self.header)
+        response = await async_views.get_user_profile_stats(request)
+
+        stats = await sync_to_async(UserProfile.get_stats)()
+        self.assertEqual(json.loads(response.content), stats)
+
+
+class RateLimitTest(APITestCase):
+    def setUp(self):
+        cache.clear()
+
+    def test_limiter_blocks_after_limit(self):
+        limiter = SlidingWindowLimiter("test", limit=3, window=60)
+
+        results = [limiter.hit("user", now=120) for _ in range(4)]
+
+        self.assertEqual(results[:3], [0, 0, 0])
+        self.assertEqual(results[3], 60)
+
+    def test_limiter_slides_previous_window(self):
+        limiter = SlidingWindowLimiter("test", limit=3, window=60)
+        for _ in range(3):
+            limiter.hit("user", now=120)
+
+        self.assertTrue(limiter.hit("user", now=190))
+        self.assertEqual(limiter.hit("other", now=190), 0)
+
+    def test_limiter_lockout(self):
+        limiter = SlidingWindowLimiter("test", limit=1, window=60, lockout=300)
+        limiter.hit("user", now=120)
+
+        self.assertEqual(limiter.hit("user", now=121), 300)
+        self.assertEqual(limiter.hit("user", now=150), 271)
+
+    @override_settings(
+        AUTHENTICATION_RATE_LIMITS={"login_failures": (1, 60, 0)}
+    )
+    def test_token_endpoint_throttled_before_db(self):
+        CustomUser.objects.create_user("limited", password="pw")
+        url = reverse("obtain_jwt_token")
+        data = {"username": "limited", "password": "wrong"}
+        self.client.post(url, data, format="json")
+
+        with self.assertNumQueries(0):
+            response = self.client.post(url, data, format="json")
+
+        self.assertEqual(
+            response.status_code, status.HTTP_429_TOO_MANY_REQUESTS
+        )
+
+    @override_settings(
+        AUTHENTICATION_RATE_LIMITS={"login_failures": (1, 60, 300)}
+    )
+    def test_token_endpoint_counts_failures_per_address(self):
+        CustomUser.objects.create_user("limited", password="pw")
+        url = reverse("obtain_jwt_token")
+        for _ in range(3):
+            ok = self.client.post(
+                url, {"username": "limited", "password": "pw"}, format="json"
+            )
+        for _ in range(2):
+            failed = self.client.post(
+                url,
+                {"username": "limited", "password": "wrong"},
+                format="json",
+                REMOTE_ADDR="10.0.0.1",
+            )
+        other = self.client.post(
+            url, {"username": "limited", "password": "pw"}, format="json"
+        )
+
+        self.assertEqual(ok.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            failed.status_code, status.HTTP_429_TOO_MANY_REQUESTS
+        )
+        self.assertEqual(other.status_code, status.HTTP_200_OK)
+
+    def test_token_endpoint_rejects_list_body(self):
+        response = self.client.post(
+            reverse("obtain_jwt_token"), [{"username": "x"}], format="json"
+        )
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    @override_settings(
+        AUTHENTICATION_RATE_LIMITS={"telegram_user": (1, 60, 300)}
+    )
+    async def test_async_telegram_connect_throttled(self):
+        user = await CustomUser.objects.acreate(username="telegram")
+        header = benchmarks.jwt_header(user)
+        factory = AsyncRequestFactory()
+        for _ in range(2):
+            response = await async_views.telegram_connect(
+                factory.get("/", {"code": "1"}, HTTP_AUTHORIZATION=header)
+            )
+
+        self.assertEqual(
+            response.status_code, status.HTTP_429_TOO_MANY_REQUESTS
+        )
+        self.assertEqual(response["Retry-After"], "300")
+
+
+@override_settings(AUTHENTICATION_TASKS_EAGER=True)
+class PhotoProcessingTest(TestCase):
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root)
+        media = override_settings(MEDIA_ROOT=self.media_root)
+        media.enable()
+        self.addCleanup(media.disable)
+
+        user = CustomUser.objects.create(username="photo")
+        self.profile = UserProfile.objects.create(user=user)
+
+    def upload(self, size=(2000, 1500)):
+        buffer = BytesIO()
+        Image.new("RGB", size, "red").save(buffer, "JPEG")
+        self.profile.photo = SimpleUploadedFile(
+            "photo.jpg", buffer.getvalue(), content_type="image/jpeg"
+        )
+        with self.captureOnCommitCallbacks(execute=True):
+            self.profile.save()
+        self.profile.refresh_from_db()
+
+    def test_variants_are_created(self):
+        self.upload()
+
+        variants = self.profile.photo_variants
+        self.assertEqual(set(variants), {str(w) for w in PHOTO_WIDTHS})
+        with self.profile.photo.storage.open(variants["96"]["webp"]) as f:
+            self.assertEqual(Image.open(f).size, (96, 72))
+
+    def test_replacing_photo_drops_old_variants(self):
+        self.upload()
+        old_name = self.profile.photo_variants["96"]["jpeg"]
+
+        self.upload(size=(400, 400))
+
+        self.assertFalse(self.profile.photo.storage.exists(old_name))
+        self.assertNotEqual(
+            self.profile.photo_variants["96"]["jpeg"], old_name
+        )
+
+    def test_serializer_returns_variant_urls(self):
+        self.upload()
+        request = APIRequestFactory().get("/profiles/")
+
+        data = UserProfileSerializer(
+            [self.profile], many=True, context={"request": request}
+        ).data[0]
+
+        self.assertTrue(data["photo"].startswith("https://testserver/"))
+        self.assertTrue(
+            data["photo_variants"]["320"]["webp"].startswith(
+                "https://testserver/"
+            )
+        )
+
+
+class CustomUserAdminTest(TestCase):
+    def setUp(self):
+        self.model_admin = CustomUserAdmin(CustomUser, AdminSite())
+        self.request = APIRequestFactory().get("/admin/")
+        CustomUser.objects.create(username="ivanov", middle_name="Иванов")
+        CustomUser.objects.create(username="petr", middle_name="Петров")
+
+    def test_queryset_has_no_role_annotations(self):
+        queryset = self.model_admin.get_queryset(self.request)
+
+        self.assertNotIn("is_student", queryset.query.annotations)
+
+    def test_prefix_search_capitalizes_names(self):
+        queryset, duplicates = self.model_admin.get_search_results(
+            self.request, self.model_admin.get_queryset(self.request), "иван"
+        )
+
+        self.assertFalse(duplicates)
+        self.assertEqual(
+            list(queryset.values_list("username", flat=True)), ["ivanov"]
+        )
+
+    def test_filtered_count_is_exact(self):
+        queryset = self.model_admin.get_queryset(self.request).filter(
+            username__in=["ivanov", "petr"]
+        )
+        paginator = EstimatedCountPaginator(queryset, 1)
+        paginator.estimate_above = 1
+
+        self.assertEqual(paginator.count, 2)
+        self.assertEqual(paginator.num_pages, 2)
+
+    def test_search_matches_username(self):
+        queryset, _ = self.model_admin.get_search_results(
+            self.request, self.model_admin.get_queryset(self.request), "PET"
+        )
+
+        self.assertEqual(
+            list(queryset.values_list("username", flat=True)), ["petr"]
+        )
+
+    def test_search_keeps_inner_capitals(self):
+        CustomUser.objects.create(username="dicaprio", middle_name="ДиКаприо")
+        CustomUser.objects.create(
+            username="vodkina", middle_name="Петрова-Водкина"
+        )
+        queryset = self.model_admin.get_queryset(self.request)
+
+        for term, username in (
+            ("ДиК", "dicaprio"),
+            ("Петрова-В", "vodkina"),
+            ("петрова-водкина", "vodkina"),
+            ("петр", "petr"),
+        ):
+            with self.subTest(term):
+                found, _ = self.model_admin.get_search_results(
+                    self.request, queryset, term
+                )
+                self.assertIn(
+                    username, found.values_list("username", flat=True)
+                )
+
+
+class UserEffectiveContractsTest(APITestCase):
+    def setUp(self):
+        employee = CustomUser.objects.create(username="employee")
+        employee.roles.add(Role.objects.create(id=Role.EMPLOYEE))
+        self.client.force_authenticate(CustomUser.objects.get(pk=employee.pk))
+        self.user = CustomUser.objects.create(
+            username="owner", middle_name="Иванов", first_name="Иван"
+        )
+        items = EffectiveContract._meta.get_field("effectivecontractitem")
+        self.items_accessor = items.get_accessor_name()
+        self.type_of_work = items.related_model._meta.get_field(
+            "type_of_work"
+        ).related_model.objects.create()
+
+    def add_contracts(self, count, items=2):
+        for _ in range(count):
+            contract = self.user.effectivecontract_set.create()
+            for _ in range(items):
+                getattr(contract, self.items_accessor).create(
+                    type_of_work=self.type_of_work
+                )
+
+    def get(self, pk=None, **params):
+        url = reverse("user_contracts", args=[pk or self.user.pk])
+        return self.client.get(url, params)
+
+    def test_unknown_user(self):
+        response = self.get(self.user.pk + 1000)
+
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_whole_list(self):
+        self.add_contracts(3)
+        response = self.get()
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(set(response.data), {"fullname", "data"})
+        self.assertEqual(response.data["fullname"], "Иванов Иван ")
+        self.assertEqual(len(response.data["data"]), 3)
+
+    def test_pages(self):
+        self.add_contracts(3)
+
+        first = self.get(page_size=2).data
+        last = self.get(page=2, page_size=2).data
+
+        self.assertEqual(
+            set(first), {"fullname", "data", "count", "next", "previous"}
+        )
+        self.assertEqual((first["count"], len(first["data"])), (3, 2))
+        self.assertIsNotNone(first["next"])
+        self.assertIsNone(first["previous"])
+        self.assertEqual((last["count"], len(last["data"])), (3, 1))
+        self.assertIsNone(last["next"])
+        self.assertIsNotNone(last["previous"])
+
+    def test_queries_do_not_grow_with_contracts(self):
+        for params in ({}, {"page": 1}):
+            with self.subTest(**params):
+                self.add_contracts(1)
+                self.get(**params)
+                with CaptureQueriesContext(connection) as queries:
+                    self.get(**params)
+                self.add_contracts(4)
+
+                with self.assertNumQueries(len(queries)):
+                    response = self.get(**params)
+
+                self.assertGreaterEqual(len(response.data["data"]), 5)
+
+
+@override_settings(INTERNAL_API_KEY="secret")
+class NotificationAudienceTest(APITestCase):
+    def setUp(self):
+        cache.clear()
+        self.url = reverse("notification_audience")
+        employee = Role.objects.create(id=Role.EMPLOYEE)
+        student = Role.objects.create(id=Role.STUDENT)
+        self.department = Department.objects.create(name="Отдел")
+        for telegram_id, role in ((1, employee), (2, employee), (3, student)):
+            user = CustomUser.objects.create(
+                username=f"tg{telegram_id}", telegram_id=telegram_id
+            )
+            user.roles.add(role)
+        CustomUser.objects.create(username="silent").roles.add(employee)
+        UserProfile.objects.filter(user__username="tg2").update(
+            work_department=self.department
+        )
+
+    def post(self, data, key="secret"):
+        response = self.client.post(
+            self.url, data, format="json", HTTP_X_API_KEY=key
+        )
+        if response.streaming:
+            return json.loads(b"".join(response.streaming_content))
+        return response
+
+    def test_requires_api_key(self):
+        response = self.post({"roles": ["employee"]}, key="wrong")
+
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+    def test_by_role(self):
+        self.assertEqual(self.post({"roles": ["employee"]}), [1, 2])
+
+    def test_by_department(self):
+        self.assertEqual(
+            self.post(
+                {"roles": ["employee"], "department": self.department.pk}
+            ),
+            [2],
+        )
+
+    def test_result_is_cached(self):
+        self.post({"roles": ["student"]})
+
+        with self.assertNumQueries(0):
+            response = self.post({"roles": ["student"]})
+
+        self.assertEqual(response.data, [3])
+
+    def test_empty_spec_is_rejected(self):
+        response = self.post({})
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class RequirementTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.admin = CustomUser.objects.create(username="admin")
+        self.owner = CustomUser.objects.create(username="owner")
+
+    def requirement(self, admin=None, confirmed=False):
+        return Requirement.objects.create(
+            admin=admin or self.admin,
+            effective_contract=self.owner.effectivecontract_set.create(),
+            confirmed=confirmed,
+        )
+
+    def test_pending_count_is_cached(self):
+        self.assertEqual(Requirement.get_pending_count(self.admin), 0)
+
+        with self.assertNumQueries(0):
+            self.assertEqual(Requirement.get_pending_count(self.admin), 0)
+
+    def test_set_confirmed_runs_one_update(self):
+        with self.assertNumQueries(1):
+            updated = Requirement.set_confirmed(self.admin, [1, 2, 3])
+
+        self.assertEqual(updated, 0)
+
+    def test_set_confirmed_flips_rows(self):
+        rows = [self.requirement(), self.requirement()]
+        other = self.requirement(CustomUser.objects.create(username="other"))
+        contracts = [row.effective_contract_id for row in rows]
+
+        updated = Requirement.set_confirmed(
+            self.admin, contracts + [other.effective_contract_id]
+        )
+
+        self.assertEqual(updated, 2)
+        self.assertEqual(Requirement.objects.filter(confirmed=True).count(), 2)
+        other.refresh_from_db()
+        self.assertFalse(other.confirmed)
+
+        updated = Requirement.set_confirmed(
+            self.admin, contracts[:1], confirmed=False
+        )
+
+        self.assertEqual(updated, 1)
+
+    def test_set_confirmed_skips_confirmed_rows(self):
+        rows = [self.requirement(confirmed=True), self.requirement()]
+
+        updated = Requirement.set_confirmed(
+            self.admin, [row.effective_contract_id for row in rows]
+        )
+
+        self.assertEqual(updated, 1)
+
+    def test_pending_count_is_dropped_on_changes(self):
+        row = self.requirement()
+        self.assertEqual(Requirement.get_pending_count(self.admin), 1)
+
+        self.requirement()
+        self.assertEqual(Requirement.get_pending_count(self.admin), 2)
+
+        row.delete()
+        self.assertEqual(Requirement.get_pending_count(self.admin), 1)
+
+        Requirement.set_confirmed(
+            self.admin,
+            Requirement.objects.values_list("effective_contract", flat=True),
+        )
+        self.assertEqual(Requirement.get_pending_count(self.admin), 0)
+
+
+@tag("benchmark")
+class ImportTimeTest(SimpleTestCase):
+    def test_import_budget(self):
+        times = benchmarks.import_times("authentication.urls")
+
+        self.assertIn("authentication.urls", times["modules"])
+        self.assertLessEqual(
+            times["startup_ms"],
+            getattr(
+                settings,
+                "AUTHENTICATION_IMPORT_BUDGET_MS",
+                benchmarks.IMPORT_BUDGET_MS,
+            ),
+        )
+        for module in ("effective_contract.serializers", "PIL.Image"):
+            self.assertNotIn(module, times["modules"])
+
+
+class ReconcileStudentGroupsTest(TestCase):
+    def setUp(self):
+        self.group = Group.objects.create(name="G-1")
+        other = Group.objects.create(name="G-2")
+        self.discipline = Discipline.objects.create(group=self.group)
+        other_discipline = Discipline.objects.create(group=other)
+        self.journal, other_journal = [
+            Journal.objects.create(
+                group=discipline.group,
+                discipline=discipline,
+                date=datetime.date(2024, 9, 2),
+            )
+            for discipline in (self.discipline, other_discipline)
+        ]
+        self.student = CustomUser.objects.create(username="student")
+        StudentProfile.objects.create(user=self.student, group=self.group)
+
+        # a missing row of the group and a stale row of the other group
+        GradeSum.objects.filter(student=self.student).delete()
+        GradeSum.objects.create(
+            student=self.student, discipline=other_discipline
+        )
+        JournalLog.objects.filter(student=self.student).delete()
+        JournalLog.objects.create(
+            journal=other_journal,
+            discipline=other_discipline,
+            group=other,
+            student=self.student,
+            date=other_journal.date,
+        )
+
+    def rows(self):
+        return (
+            list(
+                GradeSum.objects.filter(student=self.student).values_list(
+                    "discipline", flat=True
+                )
+            ),
+            list(
+                JournalLog.objects.filter(student=self.student).values_list(
+                    "journal", flat=True
+                )
+            ),
+        )
+
+    def test_dry_run_without_students(self):
+        out = StringIO()
+        call_command(
+            "reconcile_student_groups",
+            Group.objects.create(name="G-3").pk,
+            dry_run=True,
+            workers=0,
+            stdout=out,
+        )
+
+        self.assertIn("found: students=0", out.getvalue())
+
+    def test_dry_run_counts(self):
+        rows = self.rows()
+
+        result = reconcile.reconcile_group(self.group.pk, dry_run=True)
+
+        self.assertEqual(
+            {counter: result[counter] for counter in reconcile.COUNTERS},
+            {
+                "students": 1,
+                "missing_grade_sums": 1,
+                "stale_grade_sums": 1,
+                "missing_journal_logs": 1,
+                "stale_journal_logs": 1,
+            },
+        )
+        self.assertEqual(self.rows(), rows)
+
+    def test_fix(self):
+        out = StringIO()
+        call_command(
+            "reconcile_student_groups", self.group.pk, workers=0, stdout=out
+        )
+
+        self.assertIn(
+            "fixed: students=1, missing_grade_sums=1, stale_grade_sums=1,"
+            " missing_journal_logs=1, stale_journal_logs=1",
+            out.getvalue(),
+        )
+        self.assertEqual(
+            self.rows(), ([self.discipline.pk], [self.journal.pk])
+        )
+        result = reconcile.reconcile_group(self.group.pk, dry_run=True)
+        self.assertFalse(any(result[c] for c in reconcile.COUNTERS[1:]))
+
+
+@override_settings(INTERNAL_API_KEY="legacy")
+class InternalApiKeyTest(APITestCase):
+    def setUp(self):
+        usage.flush()
+        cache.clear()
+        registry.clear()
+        self.url = reverse("notification_audience")
+        _, self.bot_key = InternalApiKey.issue("bot", ["notifications"])
+        _, self.other_key = InternalApiKey.issue("other", ["snapshot"])
+
+    def post(self, key):
+        return self.client.post(
+            self.url, {"roles": ["student"]}, format="json", HTTP_X_API_KEY=key
+        )
+
+    def test_key_is_stored_hashed(self):
+        self.assertFalse(
+            InternalApiKey.objects.filter(key_hash=self.bot_key).exists()
+        )
+
+    def test_scoped_key(self):
+        self.assertEqual(self.post(self.bot_key).status_code, 200)
+        self.assertEqual(self.post(self.other_key).status_code, 403)
+
+    def test_lookup_is_cached(self):
+        registry.load()
+
+        with self.assertNumQueries(0):
+            client = registry.get(self.bot_key)
+
+        self.assertEqual(client.service, "bot")
+
+    def test_inactive_key_is_rejected(self):
+        InternalApiKey.objects.filter(service="bot").update(is_active=False)
+        registry.clear()
+
+        self.assertEqual(self.post(self.bot_key).status_code, 403)
+
+    def test_legacy_key(self):
+        self.assertEqual(self.post("legacy").status_code, 200)
+
+    def test_usage_is_counted(self):
+        b"".join(self.post(self.bot_key).streaming_content)
+        self.post(self.bot_key)
+        usage.flush()
+
+        self.assertEqual(usage.get(["bot"])["bot"]["requests"], 2)
+
+    def test_idle_usage_is_flushed_by_timer(self):
+        idle = ApiUsage()
+        idle.flush_seconds = 0.01
+
+        idle.record("idle", 5.0)
+        idle._timer.join()
+
+        self.assertEqual(idle.get(["idle"])["idle"]["requests"], 1)
+
+    def test_streamed_usage_is_counted_when_sent(self):
+        response = self.post(self.bot_key)
+        usage.flush()
+
+        self.assertEqual(usage.get(["bot"])["bot"]["requests"], 0)
+
+        b"".join(response.streaming_content)
+        usage.flush()
+
+        self.assertEqual(usage.get(["bot"])["bot"]["requests"], 1)
+
+
+@override_settings(INTERNAL_API_KEY=None)
+class HrProfileSyncTest(APITestCase):
+    def setUp(self):
+        registry.clear()
+        _, self.key = InternalApiKey.issue("hr", ["hr"])
+        self.department = Department.objects.create(name="Кафедра")
+        self.staff = CustomUser.objects.create(username="staff")
+        self.staff.roles.add(Role.objects.create(id=Role.EMPLOYEE))
+        UserProfile.objects.filter(user=self.staff).update(position="Доцент")
+        newcomer = CustomUser.objects.create(username="newcomer")
+        newcomer.roles.add(Role.objects.create(id=Role.TEACHER))
+        # a teacher whose profile is not there yet
+        UserProfile.objects.filter(user=newcomer).delete()
+        CustomUser.objects.create(username="student")
+
+    def sync(self, rows):
+        return self.client.post(
+            reverse("hr_profile_sync"),
+            rows,
+            format="json",
+            HTTP_X_API_KEY=self.key,
+        )
+
+    def test_sync(self):
+        response = self.sync(
+            [
+                {"username": "staff", "position": "Доцент"},
+                {
+                    "username": "staff",
+                    "work_department": self.department.pk,
+                    "academic_degree": "к.т.н.",
+                },
+                {"username": "newcomer", "position": "Инженер"},
+                {"username": "missing", "position": "Инженер"},
+                {"username": "student", "position": "Инженер"},
+                {"username": "staff", "work_department": 10**6},
+                {"username": "staff", "position": "x" * 300},
+            ]
+        )
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            [row["status"] for row in response.data],
+            [
+                "unchanged",
+                "updated",
+                "created",
+                "unknown_user",
+                "not_staff",
+                "unknown_department",
+                "invalid",
+            ],
+        )
+        self.assertIn("position", response.data[6]["errors"])
+        profile = UserProfile.objects.get(user=self.staff)
+        self.assertEqual(profile.work_department, self.department)
+        self.assertEqual(profile.academic_degree, "к.т.н.")
+        self.assertEqual(profile.position, "Доцент")
+        self.assertEqual(
+            UserProfile.objects.get(user__username="newcomer").position,
+            "Инженер",
+        )
+        self.assertFalse(
+            UserProfile.objects.filter(user__username="student").exists()
+        )
+
+    def test_unchanged_rows_are_not_written(self):
+        rows = [{"username": "staff", "position": "Доцент"}]
+
+        with self.assertNumQueries(2):
+            self.assertEqual(UserProfile.bulk_upsert(rows), ["unchanged"])
+
+    def test_requires_list(self):
+        self.assertEqual(self.sync({"username": "staff"}).status_code, 400)
+        self.assertEqual(self.sync([]).status_code, 400)
+
+    def test_requires_scope(self):
+        _, key = InternalApiKey.issue("bot", ["notifications"])
+
+        response = self.client.post(
+            reverse("hr_profile_sync"),
+            [{"username": "staff"}],
+            format="json",
+            HTTP_X_API_KEY=key,
+        )
+
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+
+class ValuesSerializerTest(TestCase):
+    def setUp(self):
+        self.institute = Institute.objects.create(name="ИТ")
+        department = Department.objects.create(
+            name="Отдел", institute=self.institute, allow_application=True
+        )
+        employee = Role.objects.create(id=Role.EMPLOYEE)
+        teacher = Role.objects.create(id=Role.TEACHER)
+        for username, roles in (("a", [teacher, employee]), ("b", [])):
+            user = CustomUser.objects.create(
+                username=username, middle_name="Иванов", first_name="Иван"
+            )
+            user.roles.add(*roles)
+            UserProfile.objects.get_or_create(user=user)
+        UserProfile.objects.filter(user__username="a").update(
+            work_department=department,
+            institute=self.institute,
+            position="Инженер",
+            photo="user_photo/a.jpg",
+            photo_variants={"96": {"webp": "user_photo/a_96.webp"}},
+        )
+        self.context = {"request": APIRequestFactory().get("/")}
+
+    def assertSameJSON(self, expected, data):
+        render = JSONRenderer().render
+        self.assertEqual(render(expected), render(data))
+
+    def test_users(self):
+        users = CustomUser.objects.order_by("pk")
+
+        self.assertSameJSON(
+            UserSerializer(users, many=True).data,
+            UserValuesSerializer(UserValuesSerializer.values(users)).data,
+        )
+
+    def test_profiles(self):
+        profiles = UserProfile.objects.order_by("pk")
+
+        self.assertSameJSON(
+            UserProfileSerializer(
+                profiles, many=True, context=self.context
+            ).data,
+            UserProfileValuesSerializer(
+                UserProfileValuesSerializer.values(profiles),
+                context=self.context,
+            ).data,
+        )
+
+    def test_enum_field(self):
+        Institute.objects.create(name="Управление", unit=Institute.ADMIN)
+        institutes = Institute.objects.order_by("pk")
+
+        self.assertSameJSON(
+            InstituteSerializer(institutes, many=True).data,
+            InstituteValuesSerializer(
+                InstituteValuesSerializer.values(institutes)
+            ).data,
+        )
+
+    def test_no_query_per_row(self):
+        rows = list(
+            UserValuesSerializer.values(CustomUser.objects.order_by("pk"))
+        )
+
+        with self.assertNumQueries(1):
+            UserValuesSerializer(rows).data
+
+
+class AutocompleteTest(APITestCase):
+    def setUp(self):
+        teacher = Role.objects.create(id=Role.TEACHER)
+        self.ivanov = CustomUser.objects.create(
+            username="ivanov",
+            middle_name="Иванов",
+            first_name="Пётр",
+            last_name="Сергеевич",
+        )
+        self.ivanov.roles.add(teacher)
+        self.ivashov = CustomUser.objects.create(
+            username="ivashov", middle_name="Ивашов", first_name="Олег"
+        )
+        self.index = autocomplete.NameIndex()
+        self.index.build()
+
+    def test_prefix_search(self):
+        self.assertEqual(
+            self.index.search("ива"),
+            [
+                (self.ivanov.pk, "Иванов Пётр Сергеевич"),
+                (self.ivashov.pk, "Ивашов Олег "),
+            ],
+        )
+        self.assertEqual(
+            [pk for pk, _ in self.index.search("петр")], [self.ivanov.pk]
+        )
+
+    def test_role_filter(self):
+        self.assertEqual(
+            [pk for pk, _ in self.index.search("ива", role=Role.TEACHER)],
+            [self.ivanov.pk],
+        )
+
+    def test_incremental_updates(self):
+        autocomplete.index, index = self.index, autocomplete.index
+        self.addCleanup(setattr, autocomplete, "index", index)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.ivashov.middle_name = "Сидоров"
+            self.ivashov.save()
+            self.ivashov.roles.add(Role.objects.get(id=Role.TEACHER))
+
+        self.assertEqual(
+            [pk for pk, _ in self.index.search("ива")], [self.ivanov.pk]
+        )
+        self.assertEqual(
+            [pk for pk, _ in self.index.search("сид", role=Role.TEACHER)],
+            [self.ivashov.pk],
+        )
+
+    def test_rebuilt_in_background_when_version_changes(self):
+        index = autocomplete.NameIndex(sync_seconds=0)
+        index.build()
+        autocomplete.invalidate()
+
+        with mock.patch.object(index, "_build") as build:
+            self.assertEqual(index.search("ива")[0][0], self.ivanov.pk)
+            index.rebuild_thread.join()
+
+        build.assert_called_once_with()
+
+    def test_own_changes_keep_the_index_current(self):
+        autocomplete.index, index = self.index, autocomplete.index
+        self.addCleanup(setattr, autocomplete, "index", index)
+        self.index.sync_seconds = 0
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.ivashov.middle_name = "Сидоров"
+            self.ivashov.save()
+        with mock.patch.object(self.index, "_build") as build:
+            found = self.index.search("сид")
+
+        build.assert_not_called()
+        self.assertEqual([pk for pk, _ in found], [self.ivashov.pk])
+
+    def test_unrelated_saves_do_not_invalidate(self):
+        version = cache.get(autocomplete.VERSION_KEY)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.ivanov.telegram_id = 1
+            self.ivanov.save()
+            UserProfile.objects.create(user=self.ivashov).save()
+
+        # the created profile only
+        self.assertEqual(cache.get(autocomplete.VERSION_KEY), version + 1)
+
+    def test_rolled_back_change_is_not_applied(self):
+        autocomplete.index, index = self.index, autocomplete.index
+        self.addCleanup(setattr, autocomplete, "index", index)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            with self.assertRaises(ValueError):
+                with transaction.atomic():
+                    self.ivashov.middle_name = "Сидоров"
+                    self.ivashov.save()
+                    raise ValueError
+
+        self.assertEqual(self.index.search("сид"), [])
+
+    def test_concurrent_first_use_builds_once(self):
+        index = autocomplete.NameIndex()
+        builds = []
+
+        def slow_build():
+            # no queries, the other threads have no test database
+            builds.append(threading.get_ident())
+            time.sleep(0.05)
+            index.synced = time.monotonic()
+            index.built = True
+
+        with mock.patch.object(index, "_build", side_effect=slow_build):
+            threads = [
+                threading.Thread(target=index.search, args=("ива",))
+                for _ in range(4)
+            ]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+
+        self.assertEqual(len(builds), 1)
+
+    def test_endpoint(self):
+        autocomplete.index, index = self.index, autocomplete.index
+        self.addCleanup(setattr, autocomplete, "index", index)
+        self.client.force_authenticate(self.ivanov)
+
+        response = self.client.get(
+            reverse("users_autocomplete"), {"q": "ИВАН", "role": "teacher"}
+        )
+
+        self.assertEqual(
+            response.data,
+            [{"id": self.ivanov.pk, "fullname": "Иванов Пётр Сергеевич"}],
+        )
+
+
+class DirectorySnapshotTest(TestCase):
+    def setUp(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        self.path = os.path.join(directory, "directory.sqlite3")
+        self.user = CustomUser.objects.create(
+            username="snap", middle_name="Иванов"
+        )
+        self.user.roles.add(
+            Role.objects.create(id=Role.TEACHER),
+            Role.objects.create(id=Role.EMPLOYEE),
+        )
+
+    def read(self, sql):
+        db = sqlite3.connect(self.path)
+        try:
+            return db.execute(sql).fetchall()
+        finally:
+            db.close()
+
+    def test_snapshot_contents(self):
+        result = snapshot.write_snapshot(self.path)
+
+        self.assertFalse(result["incremental"])
+        self.assertEqual(
+            self.read("SELECT id, middle_name, roles FROM users"),
+            [
+                (
+                    self.user.pk,
+                    "Иванов",
+                    1 << Role.TEACHER | 1 << Role.EMPLOYEE,
+                )
+            ],
+        )
+        self.assertEqual(len(self.read("SELECT * FROM profiles")), 1)
+
+    def test_incremental_snapshot(self):
+        snapshot.write_snapshot(self.path)
+        self.assertEqual(snapshot.write_snapshot(self.path)["changed_rows"], 0)
+
+        CustomUser.objects.filter(pk=self.user.pk).update(middle_name="Петров")
+        result = snapshot.write_snapshot(self.path)
+
+        self.assertTrue(result["incremental"])
+        self.assertEqual(result["changes"]["users"], 1)
+        self.assertEqual(result["generation"], 3)
+        self.assertEqual(
+            self.read("SELECT middle_name FROM users"), [("Петров",)]
+        )
+
+    def test_deleted_rows_are_removed(self):
+        snapshot.write_snapshot(self.path)
+        self.user.delete()
+
+        snapshot.write_snapshot(self.path)
+
+        self.assertEqual(self.read("SELECT * FROM users"), [])
+        self.assertEqual(self.read("SELECT * FROM profiles"), [])
+
+    def test_writers_take_turns(self):
+        written = []
+
+        with mock.patch.object(
+            snapshot,
+            "_write_snapshot",
+            side_effect=lambda path, full: written.append(path),
+        ):
+            with open(f"{self.path}.lock", "a") as lock:
+                fcntl.flock(lock, fcntl.LOCK_EX)
+                writer = threading.Thread(
+                    target=snapshot.write_snapshot, args=(self.path,)
+                )
+                writer.start()
+                writer.join(0.1)
+                self.assertEqual(written, [])
+                fcntl.flock(lock, fcntl.LOCK_UN)
+            writer.join()
+
+        self.assertEqual(written, [self.path])
+
+    @override_settings(DIRECTORY_SNAPSHOT_PATH=None)
+    def test_path_is_required(self):
+        with self.assertRaises(ImproperlyConfigured):
+            snapshot.get_snapshot_path()
+
+    @override_settings(AUTHENTICATION_TASKS_EAGER=True)
+    def test_endpoint(self):
+        registry.clear()
+        self.addCleanup(registry.clear)
+        _, key = InternalApiKey.issue("mobile", ["directory"])
+        url = reverse("directory_snapshot")
+
+        with override_settings(DIRECTORY_SNAPSHOT_PATH=self.path):
+            queued = self.client.post(url, HTTP_X_API_KEY=key)
+            download = self.client.get(url, HTTP_X_API_KEY=key)
+            b"".join(download.streaming_content)
+
+        self.assertEqual(queued.status_code, status.HTTP_202_ACCEPTED)
+        self.assertEqual(queued.json(), {"generation": None})
+        self.assertEqual(download["ETag"], '"1"')
+
+
+class TokenRevocationTest(APITestCase):
+    def setUp(self):
+        cache.clear()
+        revocation.revocations.clear()
+        self.role = Role.objects.create(id=Role.EMPLOYEE)
+        self.user = CustomUser.objects.create_user("revoked", password="pw")
+        self.user.roles.add(self.role)
+
+    def token(self):
+        payload = custom_jwt_payload.jwt_payload_handler(self.user)
+        return payload, api_settings.JWT_ENCODE_HANDLER(payload)
+
+    def assertRevoked(self, token):
+        with self.assertRaises(jwt.InvalidTokenError):
+            custom_jwt_payload.jwt_decode_handler(token)
+
+    def test_bloom_filter(self):
+        bloom = revocation.BloomFilter(1000, 0.01)
+        for n in range(1000):
+            bloom.add(f"jti:{n}")
+
+        self.assertTrue(all(f"jti:{n}" in bloom for n in range(1000)))
+        self.assertLess(sum(f"user:{n}" in bloom for n in range(1000)), 50)
+        with self.assertRaises(ValueError):
+            revocation.BloomFilter(10, 0.01, bytes(bloom.bits))
+
+    def test_valid_token_costs_no_query(self):
+        _, token = self.token()
+        revocation.revocations.sync()
+
+        with self.assertNumQueries(0):
+            payload = custom_jwt_payload.jwt_decode_handler(token)
+
+        self.assertEqual(payload["user_id"], self.user.pk)
+
+    def test_revoke_token(self):
+        payload, token = self.token()
+        _, other = self.token()
+
+        revocation.revocations.revoke_token(payload)
+
+        self.assertRevoked(token)
+        custom_jwt_payload.jwt_decode_handler(other)
+
+    def test_role_loss_revokes_tokens(self):
+        _, token = self.token()
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user.roles.remove(self.role)
+
+        self.assertRevoked(token)
+
+    def test_deactivation_revokes_tokens(self):
+        _, token = self.token()
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user.is_active = False
+            self.user.save()
+
+        self.assertRevoked(token)
+
+    def test_other_processes_sync(self):
+        other = revocation.RevocationList(sync_seconds=0)
+        payload, _ = self.token()
+        other.sync()
+
+        revocation.revocations.revoke_user(self.user.pk)
+
+        # the published filter is loaded, only the hit is checked
+        with self.assertNumQueries(1):
+            self.assertTrue(other.is_revoked(payload))
+
+    def test_role_side_removal_revokes_tokens(self):
+        _, token = self.token()
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.role.customuser_set.remove(self.user)
+
+        self.assertRevoked(token)
+        self.assertFalse(UserProfile.objects.filter(user=self.user).exists())
+
+    def test_role_side_clear_revokes_tokens(self):
+        _, token = self.token()
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.role.customuser_set.clear()
+
+        self.assertRevoked(token)
+        self.assertFalse(UserProfile.objects.filter(user=self.user).exists())
+
+    def test_endpoint(self):
+        payload, token = self.token()
+        self.client.force_authenticate(self.user, token=token)
+
+        response = self.client.post(reverse("revoke_jwt_token"))
+
+        self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
+        self.assertTrue(revocation.revocations.is_revoked(payload))
+
+
+class BrsScopeTest(APITestCase):
+    def setUp(self):
+        cache.clear()
+        self.institute = BrsInstitute.objects.create(name="ИМИТ")
+        other_institute = BrsInstitute.objects.create(name="ИФ")
+        self.admin = CustomUser.objects.create(username="brs_admin")
+        self.admin.roles.add(Role.objects.create(id=Role.BRS_ADMIN))
+        BrsAdminProfile.objects.filter(user=self.admin).update(
+            institute=self.institute
+        )
+        self.group = Group.objects.create(
+            name="G-1", institute=self.institute
+        )
+        self.other_group = Group.objects.create(
+            name="G-2", institute=other_institute
+        )
+        self.department = BrsDepartment.objects.create(
+            name="Кафедра", institute=self.institute
+        )
+        student_role = Role.objects.create(id=Role.STUDENT)
+        self.students = []
+        for username, group in (("s1", self.group), ("s2", self.other_group)):
+            user = CustomUser.objects.create(username=username)
+            user.roles.add(student_role)
+            profile = StudentProfile.objects.get(user=user)
+            profile.group = group
+            profile.save()
+            self.students.append(profile)
+
+    def test_default_sources_exist(self):
+        for label, lookup in scopes.DEFAULT_SOURCES.values():
+            with self.subTest(label):
+                apps.get_model(label)._meta.get_field(lookup)
+
+    def test_scope_of_institute(self):
+        scope = scopes.get_scope(self.admin)
+
+        self.assertEqual(scope.institute, self.institute.pk)
+        self.assertEqual(scope.groups, {self.group.pk})
+        self.assertEqual(scope.departments, {self.department.pk})
+        self.assertEqual(scope.students, {self.students[0].user_id})
+        self.assertEqual(
+            list(scope.filter(Group.objects.all(), "groups")), [self.group]
+        )
+
+    def test_without_institute(self):
+        BrsAdminProfile.objects.filter(user=self.admin).update(institute=None)
+
+        scope = scopes.get_scope(self.admin)
+
+        self.assertEqual(scope.groups, frozenset())
+        self.assertFalse(
+            scope.filter(StudentProfile.objects.all(), "students", "user")
+        )
+
+    def test_scope_is_cached(self):
+        scopes.get_scope(self.admin)
+
+        with self.assertNumQueries(0):
+            scopes.get_scope(self.admin)
+
+    def test_invalidated_by_profile_change(self):
+        scopes.get_scope(self.admin)
+
+        BrsAdminProfile.objects.get(user=self.admin).save()
+
+        # the profile, the groups, the departments and the students
+        with self.assertNumQueries(4):
+            scopes.get_scope(self.admin)
+
+    def test_invalidated_by_group_change(self):
+        scopes.get_scope(self.admin)
+
+        self.students[1].group = self.group
+        self.students[1].save()
+
+        self.assertEqual(
+            scopes.get_scope(self.admin).students,
+            {profile.user_id for profile in self.students},
+        )
+
+    def test_invalidated_by_source_change(self):
+        scopes.get_scope(self.admin)
+
+        self.other_group.institute = self.institute
+        self.other_group.save()
+
+        self.assertEqual(
+            scopes.get_scope(self.admin).groups,
+            {self.group.pk, self.other_group.pk},
+        )
+
+    def test_kept_when_group_unchanged(self):
+        scopes.get_scope(self.admin)
+
+        self.students[1].distance_education = True
+        self.students[1].save()
+        StudentProfile.objects.get(pk=self.students[0].pk).save()
+
+        with self.assertNumQueries(0):
+            scopes.get_scope(self.admin)
+
+    def test_unrestricted(self):
+        self.admin.admin_dep = CustomUser.DUMR
+
+        scope = scopes.get_scope(self.admin)
+
+        self.assertTrue(scope.unrestricted)
+        self.assertEqual(
+            scope.filter(Group.objects.all(), "groups").count(), 2
+        )
+
+    def test_endpoint(self):
+        self.client.force_authenticate(
+            CustomUser.objects.get(pk=self.admin.pk)
+        )
+
+        response = self.client.get(reverse("brs_scope"))
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            response.data,
+            {
+                "institute": self.institute.pk,
+                "unrestricted": False,
+                "groups": [self.group.pk],
+                "departments": [self.department.pk],
+                "students": [self.students[0].user_id],
+            },
+        )
@@ -0,0 +1,180 @@
+import hashlib
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from rest_framework.throttling import BaseThrottle
+
+# scope: (requests, window in seconds, lockout in seconds)
+# The client address comes from DRF's get_ident, which trusts the whole
+# X-Forwarded-For header unless REST_FRAMEWORK["NUM_PROXIES"] is set to
+# the number of proxies in front of the app; without it the per address
+# limits can be bypassed by sending that header.
+DEFAULT_RATE_LIMITS = {
+    "login_ip": (30, 60, 0),
+    # failed logins of a username from an address, a lockout of the
+    # username alone would let anyone lock its owner out
+    "login_failures": (5, 60, 300),
+    "telegram_ip": (30, 60, 0),
+    "telegram_user": (5, 60, 300),
+}
+
+
+class SlidingWindowLimiter:
+    """
+    Sliding window counter on the Django cache: the hits of the current
+    fixed window plus the prorated hits of the previous one. Every
+    identity costs at most three small keys whatever its request rate,
+    and the counter is advanced with an atomic ``incr``.
+    """
+
+    def __init__(self, scope: str, limit: int, window: int, lockout: int = 0):
+        self.scope = scope
+        self.limit = limit
+        self.window = window
+        self.lockout = lockout
+
+    @classmethod
+    def for_scope(cls, scope: str):
+        limits = getattr(settings, "AUTHENTICATION_RATE_LIMITS", {})
+        return cls(scope, *limits.get(scope, DEFAULT_RATE_LIMITS[scope]))
+
+    def _key(self, identity: str, suffix) -> str:
+        digest = hashlib.blake2b(
+            str(identity).encode(), digest_size=12
+        ).hexdigest()
+        return f"rl:{self.scope}:{digest}:{suffix}"
+
+    def hit(self, identity, now: float = None) -> float:
+        """
+        Count a request of ``identity``.
+        Return 0 if it is allowed, otherwise the seconds to wait.
+        """
+        now = time.time() if now is None else now
+        current = int(now // self.window)
+        lock_key = self._key(identity, "lock")
+        current_key = self._key(identity, current)
+        previous_key = self._key(identity, current - 1)
+
+        values = cache.get_many([lock_key, previous_key])
+        if lock_key in values:
+            return max(values[lock_key] - now, 1)
+
+        if cache.add(current_key, 1, self.window * 2):
+            count = 1
+        else:
+            try:
+                count = cache.incr(current_key)
+            except ValueError:
+                # the key expired between add() and incr()
+                cache.set(current_key, 1, self.window * 2)
+                count = 1
+
+        estimate = self._estimate(values.get(previous_key, 0), count, now)
+        if estimate <= self.limit:
+            return 0
+        return self._reject(lock_key, now)
+
+    def check(self, identity, now: float = None) -> float:
+        """
+        Like ``hit``, without counting: the request is rejected once the
+        counted ones reached the limit.
+        """
+        now = time.time() if now is None else now
+        current = int(now // self.window)
+        lock_key = self._key(identity, "lock")
+        current_key = self._key(identity, current)
+        previous_key = self._key(identity, current - 1)
+
+        values = cache.get_many([lock_key, current_key, previous_key])
+        if lock_key in values:
+            return max(values[lock_key] - now, 1)
+        estimate = self._estimate(
+            values.get(previous_key, 0), values.get(current_key, 0), now
+        )
+        if estimate < self.limit:
+            return 0
+        return self._reject(lock_key, now)
+
+    def _estimate(self, previous: int, current: int, now: float) -> float:
+        elapsed = (now % self.window) / self.window
+        return previous * (1 - elapsed) + current
+
+    def _reject(self, lock_key: str, now: float) -> float:
+        if self.lockout:
+            cache.set(lock_key, now + self.lockout, self.lockout)
+            return self.lockout
+        return self.window - now % self.window
+
+
+class SlidingWindowThrottle(BaseThrottle):
+    """
+    Checks every ``(scope, identity)`` pair from ``get_identities``.
+    DRF runs throttles before the handler, so a rejected request
+    never reaches password hashing or the database. The requests of
+    ``checked_scopes`` are not counted here, the view counts them.
+    """
+
+    checked_scopes = ()
+
+    def get_identities(self, request, view):
+        raise NotImplementedError
+
+    def allow_request(self, request, view):
+        self.wait_seconds = 0
+        for scope, identity in self.get_identities(request, view):
+            if identity in (None, ""):
+                continue
+            limiter = SlidingWindowLimiter.for_scope(scope)
+            if scope in self.checked_scopes:
+                wait = limiter.check(identity)
+            else:
+                wait = limiter.hit(identity)
+            if wait:
+                self.wait_seconds = wait
+                return False
+        return True
+
+    def wait(self):
+        return self.wait_seconds
+
+
+class LoginRateThrottle(SlidingWindowThrottle):
+    """
+    Limits the logins per address and the failed logins per username
+    and address; the view reports the failures with ``record_failure``.
+    """
+
+    checked_scopes = ("login_failures",)
+
+    def get_identities(self, request, view):
+        return (
+            ("login_ip", self.get_ident(request)),
+            ("login_failures", self.failure_identity(request)),
+        )
+
+    def failure_identity(self, request):
+        # a body that is not an object is rejected by the serializer
+        data = request.data if isinstance(request.data, dict) else {}
+        username = str(data.get("username") or "")[:150].lower()
+        if not username:
+            return None
+        return f"{username}\x00{self.get_ident(request)}"
+
+    def record_failure(self, request):
+        identity = self.failure_identity(request)
+        if identity is not None:
+            SlidingWindowLimiter.for_scope("login_failures").hit(identity)
+
+
+class TelegramConnectRateThrottle(SlidingWindowThrottle):
+    """
+    Guessing tries a new code on every request, so the codes are
+    limited per client and per user rather than per code.
+    """
+
+    def get_identities(self, request, view):
+        return (
+            ("telegram_ip", self.get_ident(request)),
+            ("telegram_user", request.user.pk),
+        )
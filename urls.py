@@ -1,11 +1,20 @@
 from django.urls import path
-from rest_framework_jwt.views import obtain_jwt_token, refresh_jwt_token
+from rest_framework_jwt.views import refresh_jwt_token
 
-from authentication import views
+from authentication import async_views, views
 
 urlpatterns = [
-    path("token/", obtain_jwt_token, name="obtain_jwt_token"),
+    path(
+        "token/",
+        views.ObtainTokenView.as_view(),
+        name="obtain_jwt_token",
+    ),
     path("refresh-token/", refresh_jwt_token, name="obtain_jwt_token_refresh"),
+    path(
+        "revoke-token/",
+        views.RevokeTokenView.as_view(),
+        name="revoke_jwt_token",
+    ),
     path("institutes/", views.InstituteList.as_view(), name="institutes"),
     path(
         "institutes/<int:pk>/",
@@ -26,6 +35,7 @@ urlpatterns = [
     path(
         "users/<int:pk>/contracts/",
         views.UserEffectiveContractsList.as_view(),
+        name="user_contracts",
     ),
     path(
         "profiles-stats/",
@@ -38,5 +48,32 @@ urlpatterns = [
     path("profile/", views.UpdateUserProfiles.as_view()),
     path("profiles/", views.ListUserProfilesBy.as_view()),
     path("profile/<int:pk>/", views.GetUserProfiles.as_view()),
+    path(
+        "users/autocomplete/",
+        views.AutocompleteView.as_view(),
+        name="users_autocomplete",
+    ),
     path("telegram-connect/", views.TelegramConnectView.as_view()),
+    path("requirements/", views.RequirementsView.as_view()),
+    path("brs/scope/", views.BrsScopeView.as_view(), name="brs_scope"),
+    path(
+        "profiles/sync/",
+        views.HrProfileSyncView.as_view(),
+        name="hr_profile_sync",
+    ),
+    path(
+        "directory/snapshot/",
+        views.DirectorySnapshotView.as_view(),
+        name="directory_snapshot",
+    ),
+    path(
+        "notifications/audience/",
+        views.NotificationAudienceView.as_view(),
+        name="notification_audience",
+    ),
+    path("async/roles/", async_views.get_roles, name="async_roles"),
+    path("async/institutes/", async_views.institute_list),
+    path("async/profile/<int:pk>/", async_views.get_user_profile),
+    path("async/profiles-stats/", async_views.get_user_profile_stats),
+    path("async/telegram-connect/", async_views.telegram_connect),
 ]
\ No newline at end of file
@@ -1,31 +1,85 @@
+import hashlib
+import json
+import time
+from functools import partial
+
+from django.conf import settings
 from django.core.cache import cache
-from django.db.models import CharField, F, Value
+from django.db.models import CharField, F, Prefetch, Value
 from django.db.models.functions import Concat
+from django.http import FileResponse, HttpResponse, StreamingHttpResponse
 from rest_framework import generics, status
+from rest_framework.generics import get_object_or_404
+from rest_framework.pagination import PageNumberPagination
 from rest_framework.response import Response
+from rest_framework.serializers import ValidationError, as_serializer_error
 from rest_framework.views import APIView
+from rest_framework_jwt import utils as jwt_utils
+from rest_framework_jwt.views import ObtainJSONWebToken
 
+from authentication import autocomplete, scopes, snapshot, tasks
 from authentication.models import (
     CustomUser,
     Department,
     EducationDepartment,
     Institute,
+    Requirement,
     UserProfile,
 )
-from authentication.permissions import IsEmployee
+from authentication.permissions import (
+    HasApiScope,
+    IsBrsAdmin,
+    IsDeccan,
+    IsEmployee,
+)
+from authentication.permisson_classes import ApiClient, InternalApiAccess
+from authentication.permisson_classes import usage as api_usage
+from authentication.revocation import revocations
+from authentication.routers import ReplicaReadMixin
 from authentication.serializers import (
+    AudienceSerializer,
     DepartmentSerializer,
     EducationDepartmentSerializer,
+    HrProfileSerializer,
     InstituteSerializer,
+    InstituteValuesSerializer,
+    RequirementConfirmSerializer,
     UserProfileSerializer,
-    UserSerializer,
+    UserProfileValuesSerializer,
+    UserValuesSerializer,
+)
+from authentication.throttling import (
+    LoginRateThrottle,
+    TelegramConnectRateThrottle,
 )
 from effective_contract.models import EffectiveContract
-from effective_contract.serializers import EffectiveContractSerializer
 
 
-class InstituteList(generics.ListAPIView):
+class ValuesListMixin:
+    """
+    Lists through ``values_serializer_class``, the read-only fast twin
+    of ``serializer_class`` giving the same JSON.
+    """
+
+    values_serializer_class = None
+
+    def list(self, request, *args, **kwargs):
+        rows = self.values_serializer_class.values(
+            self.filter_queryset(self.get_queryset())
+        )
+        page = self.paginate_queryset(rows)
+        serializer = self.values_serializer_class(
+            rows if page is None else page,
+            context=self.get_serializer_context(),
+        )
+        if page is not None:
+            return self.get_paginated_response(serializer.data)
+        return Response(serializer.data, status=status.HTTP_200_OK)
+
+
+class InstituteList(ValuesListMixin, ReplicaReadMixin, generics.ListAPIView):
     serializer_class = InstituteSerializer
+    values_serializer_class = InstituteValuesSerializer
     queryset = Institute.objects.all()
     permission_classes = []
 
@@ -66,26 +120,68 @@ class UsersList(APIView):
         users = CustomUser.filter_users_by_ec(
             department, _status, istatus, self.request.user.admin_dep
         )
-        serializer = UserSerializer(users, many=True)
+        serializer = UserValuesSerializer(UserValuesSerializer.values(users))
         return Response(serializer.data, status=status.HTTP_200_OK)
 
 
+class ContractsPagination(PageNumberPagination):
+    page_size = 12
+    page_size_query_param = "page_size"
+    max_page_size = 100
+
+
 class UserEffectiveContractsList(APIView):
+    """
+    Contracts of a user with their items prefetched. The list is paged
+    when ``page`` or ``page_size`` is given, otherwise returned whole.
+    """
+
     permission_classes = [IsEmployee]
 
     def get(self, request, pk):
-        user = CustomUser.objects.get(pk=pk)
-        effective_contracts = EffectiveContract.get_user_contracts(user)
+        # django.setup() loads the models of every app, not the serializers
+        from effective_contract.serializers import EffectiveContractSerializer
+
+        user = get_object_or_404(
+            CustomUser.objects.lean().only(
+                "middle_name", "first_name", "last_name"
+            ),
+            pk=pk,
+        )
+        items = EffectiveContract._meta.get_field("effectivecontractitem")
+        effective_contracts = EffectiveContract.get_user_contracts(
+            user
+        ).prefetch_related(
+            Prefetch(
+                items.get_accessor_name(),
+                queryset=items.related_model.objects.select_related(
+                    "type_of_work"
+                ),
+            )
+        )
+        if not effective_contracts.ordered:
+            effective_contracts = effective_contracts.order_by("pk")
+
+        paginator = None
+        if {"page", "page_size"} & request.query_params.keys():
+            paginator = ContractsPagination()
+            effective_contracts = paginator.paginate_queryset(
+                effective_contracts, request, view=self
+            )
         serializer = EffectiveContractSerializer(
             effective_contracts, many=True
         )
-        return Response(
-            {"fullname": user.fio(), "data": serializer.data},
-            status=status.HTTP_200_OK,
-        )
+        data = {"fullname": user.fio(), "data": serializer.data}
+        if paginator is not None:
+            data.update(
+                count=paginator.page.paginator.count,
+                next=paginator.get_next_link(),
+                previous=paginator.get_previous_link(),
+            )
+        return Response(data, status=status.HTTP_200_OK)
 
 
-class GetUserProfiles(generics.RetrieveAPIView):
+class GetUserProfiles(ReplicaReadMixin, generics.RetrieveAPIView):
     queryset = UserProfile.objects.all()
     serializer_class = UserProfileSerializer
 
@@ -93,15 +189,18 @@ class GetUserProfiles(generics.RetrieveAPIView):
         return UserProfile.get_by_user_or_not_found(self.kwargs["pk"])
 
 
-class UpdateUserProfiles(generics.RetrieveUpdateAPIView):
+class UpdateUserProfiles(ReplicaReadMixin, generics.RetrieveUpdateAPIView):
     serializer_class = UserProfileSerializer
 
     def get_object(self):
         return UserProfile.get_by_user_or_not_found(self.request.user)
 
 
-class ListUserProfilesBy(generics.ListAPIView):
+class ListUserProfilesBy(
+    ValuesListMixin, ReplicaReadMixin, generics.ListAPIView
+):
     serializer_class = UserProfileSerializer
+    values_serializer_class = UserProfileValuesSerializer
 
     def get_queryset(self):
         filters = {}
@@ -132,7 +231,7 @@ class ListUserProfilesBy(generics.ListAPIView):
         )
 
 
-class GetUserProfileStats(APIView):
+class GetUserProfileStats(ReplicaReadMixin, APIView):
     permission_classes = [IsEmployee]
 
     def get(self, request):
@@ -141,6 +240,63 @@ class GetUserProfileStats(APIView):
         return Response(UserProfile.get_stats())
 
 
+class AutocompleteView(APIView):
+    """
+    Typeahead over user names from the in-process prefix index:
+    ``?q=иван&role=teacher&institute=1&limit=10``.
+    """
+
+    max_limit = 50
+
+    def get(self, request):
+        params = request.query_params
+        role = params.get("role")
+        if role is not None and role not in autocomplete.ROLE_IDS:
+            return Response(
+                {"role": "No matching type"},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        try:
+            institute = params.get("institute")
+            institute = int(institute) if institute else None
+            limit = min(int(params.get("limit", 10)), self.max_limit)
+        except ValueError:
+            return Response(status=status.HTTP_400_BAD_REQUEST)
+
+        results = autocomplete.index.search(
+            params.get("q", ""),
+            role=autocomplete.ROLE_IDS.get(role),
+            institute=institute,
+            limit=limit,
+        )
+        return Response(
+            [
+                {"id": user_id, "fullname": fullname}
+                for user_id, fullname in results
+            ],
+            status=status.HTTP_200_OK,
+        )
+
+
+class BrsScopeView(APIView):
+    """Ids of what the BRS admin or dean may see, see scopes.BrsScope."""
+
+    permission_classes = [IsBrsAdmin | IsDeccan]
+
+    def get(self, request):
+        scope = scopes.get_scope(request.user)
+        return Response(
+            {
+                "institute": scope.institute,
+                "unrestricted": scope.unrestricted,
+                "groups": sorted(scope.groups),
+                "departments": sorted(scope.departments),
+                "students": sorted(scope.students),
+            },
+            status=status.HTTP_200_OK,
+        )
+
+
 class GetRoles(APIView):
     def get(self, *args, **kwargs):
         user = self.request.user
@@ -148,6 +304,8 @@ class GetRoles(APIView):
 
 
 class TelegramConnectView(APIView):
+    throttle_classes = [TelegramConnectRateThrottle]
+
     def get(self, *args, **kwargs):
         code = self.request.query_params.get("code")
 
@@ -174,4 +332,245 @@ class TelegramConnectView(APIView):
         cache.delete(telegram_id)
         return Response(
             {"message": "Аккаунт Telegram привязан"}, status=status.HTTP_200_OK
-        )
\ No newline at end of file
+        )
+
+
+class ObtainTokenView(ObtainJSONWebToken):
+    """Issues a token, a rejected login counts toward its lockout."""
+
+    throttle_classes = [LoginRateThrottle]
+
+    def post(self, request, *args, **kwargs):
+        response = super().post(request, *args, **kwargs)
+        if response.status_code == status.HTTP_400_BAD_REQUEST:
+            LoginRateThrottle().record_failure(request)
+        return response
+
+
+class RevokeTokenView(APIView):
+    """Revokes the token of the request, which logs it out."""
+
+    def post(self, request):
+        if not isinstance(request.auth, (str, bytes)):
+            return Response(
+                {"detail": "Not authenticated with a token"},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        payload = jwt_utils.jwt_decode_handler(request.auth)
+        if "jti" not in payload:
+            return Response(
+                {"detail": "The token has no id"},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        revocations.revoke_token(payload)
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
+
+class RequirementsView(APIView):
+    permission_classes = [IsEmployee]
+
+    def get(self, request):
+        return Response(
+            {"pending": Requirement.get_pending_count(request.user)},
+            status=status.HTTP_200_OK,
+        )
+
+    def post(self, request):
+        serializer = RequirementConfirmSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        updated = Requirement.set_confirmed(
+            request.user,
+            serializer.validated_data["effective_contracts"],
+            serializer.validated_data["confirmed"],
+        )
+        return Response(
+            {
+                "updated": updated,
+                "pending": Requirement.get_pending_count(request.user),
+            },
+            status=status.HTTP_200_OK,
+        )
+
+
+class ClosingStream:
+    """
+    Streamed ``content`` that calls ``on_close`` once, when the server
+    closes the response after sending it.
+    """
+
+    def __init__(self, content, on_close):
+        self.content = content
+        self.on_close = on_close
+
+    def __iter__(self):
+        return iter(self.content)
+
+    def close(self):
+        on_close, self.on_close = self.on_close, None
+        if on_close is not None:
+            on_close()
+
+
+class InternalApiView(APIView):
+    """
+    Base of the endpoints for internal services: authenticated by
+    API key, limited to ``required_scope`` and counted per service.
+    """
+
+    authentication_classes = [InternalApiAccess]
+    permission_classes = [HasApiScope]
+    required_scope = None
+
+    def initial(self, request, *args, **kwargs):
+        self.started = time.perf_counter()
+        super().initial(request, *args, **kwargs)
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        response = super().finalize_response(
+            request, response, *args, **kwargs
+        )
+        client = request.auth
+        if isinstance(client, ApiClient) and hasattr(self, "started"):
+            record = partial(self.record_usage, client.service)
+            if response.streaming:
+                # the content is produced while it is sent
+                response.streaming_content = ClosingStream(
+                    response.streaming_content, record
+                )
+            else:
+                record()
+        return response
+
+    def record_usage(self, service: str):
+        api_usage.record(service, (time.perf_counter() - self.started) * 1000)
+
+
+class NotificationAudienceView(InternalApiView):
+    """
+    telegram_id of every user matching the audience spec, for the
+    Telegram bot. Results are cached per spec for AUDIENCE_CACHE_SECONDS;
+    audiences larger than AUDIENCE_CACHE_MAX_SIZE are streamed.
+    """
+
+    required_scope = "notifications"
+    chunk_size = 2000
+
+    def post(self, request):
+        serializer = AudienceSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        spec = serializer.validated_data
+
+        normalized = {
+            name: sorted(value) if isinstance(value, list) else value
+            for name, value in spec.items()
+        }
+        key = "audience:" + hashlib.sha1(
+            json.dumps(normalized, sort_keys=True).encode()
+        ).hexdigest()
+        telegram_ids = cache.get(key)
+        if telegram_ids is not None:
+            return Response(telegram_ids, status=status.HTTP_200_OK)
+
+        queryset = CustomUser.get_audience_telegram_ids(**spec)
+        return StreamingHttpResponse(
+            self.stream(queryset, key), content_type="application/json"
+        )
+
+    def stream(self, queryset, key):
+        max_size = getattr(settings, "AUDIENCE_CACHE_MAX_SIZE", 50_000)
+        collected = []
+        count = 0
+        yield "["
+        for telegram_id in queryset.iterator(chunk_size=self.chunk_size):
+            yield f",{telegram_id}" if count else str(telegram_id)
+            count += 1
+            if count <= max_size:
+                collected.append(telegram_id)
+        yield "]"
+        if count <= max_size:
+            cache.set(
+                key,
+                collected,
+                getattr(settings, "AUDIENCE_CACHE_SECONDS", 60),
+            )
+
+
+class HrProfileSyncView(InternalApiView):
+    """
+    Bulk update of staff profiles from the HR system. Takes a list of
+    ``{"username", <UserProfile.HR_FIELDS>}`` rows, returns the status
+    of every row in the same order; invalid rows are skipped.
+    """
+
+    required_scope = "hr"
+
+    def post(self, request):
+        rows = request.data
+        max_rows = getattr(settings, "HR_SYNC_MAX_ROWS", 10_000)
+        if not isinstance(rows, list) or not 0 < len(rows) <= max_rows:
+            return Response(
+                {"detail": f"Expected a list of 1 to {max_rows} rows"},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+
+        # one serializer validates every row, like many=True does
+        serializer = HrProfileSerializer()
+        results = []
+        valid = []
+        for row in rows:
+            try:
+                data = serializer.run_validation(row)
+            except ValidationError as exc:
+                results.append(
+                    {
+                        "username": row.get("username")
+                        if isinstance(row, dict)
+                        else None,
+                        "status": "invalid",
+                        "errors": as_serializer_error(exc),
+                    }
+                )
+                continue
+            results.append({"username": data["username"]})
+            valid.append(data)
+
+        statuses = iter(UserProfile.bulk_upsert(valid))
+        for result in results:
+            if "status" not in result:
+                result["status"] = next(statuses)
+        return Response(results, status=status.HTTP_200_OK)
+
+
+class DirectorySnapshotView(InternalApiView):
+    """
+    GET downloads the directory snapshot (an SQLite file), ETag is its
+    generation. POST queues an update of the snapshot from the database
+    and returns the current generation.
+    """
+
+    required_scope = "directory"
+
+    def get(self, request):
+        path = snapshot.get_snapshot_path()
+        meta = snapshot.read_meta(path)
+        if not meta:
+            return Response(status=status.HTTP_404_NOT_FOUND)
+        etag = f'"{meta["generation"]}"'
+        if request.headers.get("If-None-Match") == etag:
+            return HttpResponse(status=status.HTTP_304_NOT_MODIFIED)
+        response = FileResponse(
+            open(path, "rb"),
+            as_attachment=True,
+            filename="directory.sqlite3",
+            content_type="application/vnd.sqlite3",
+        )
+        response["ETag"] = etag
+        return response
+
+    def post(self, request):
+        meta = snapshot.read_meta(snapshot.get_snapshot_path())
+        tasks.enqueue(snapshot.write_snapshot)
+        return Response(
+            {"generation": meta.get("generation")},
+            status=status.HTTP_202_ACCEPTED,
+        )